@@ -1,5 +1,6 @@
 import sys
 import os
+import multiprocessing
 
 sys.path.append(os.path.join(os.path.dirname(__file__), 'code'))
 
@@ -67,4 +68,5 @@ class Game:
 			pygame.display.update()
 	
 if __name__ == '__main__':
+	multiprocessing.freeze_support() # simulations run in a worker process
 	game = Game()
\ No newline at end of file
@@ -0,0 +1,107 @@
+"""
+Headless batch runner: no pygame, same engine as the game.
+
+    python code/batch.py requests.jsonl -o results.jsonl --processes 4
+    python code/batch.py conditions.csv --model iML1515 --fluxes
+
+Run it from the repository root (paths resolve like the game's).
+JSON Lines input: one SimulationRequest.to_dict() per line, missing keys
+take the defaults. CSV input: columns method, objective, knockouts (gene
+ids separated by ';'), fraction, and one column per exchange id with
+'lb:ub' (empty keeps the model bounds).
+Output: one JSON line per request as it finishes, tagged with the index of
+its input line/row. FVA requests give 'ranges' ([min, max] of every
+exchange at `fraction` of the optimum) instead of a value.
+"""
+import sys
+import csv
+import json
+import argparse
+from simulation import SimulationRequest
+from screening import ScreenPool, run_batch
+from model_registry import ModelRegistry, DEFAULT_MODEL
+
+
+def parse_request(data):
+    return SimulationRequest.from_dict({**SimulationRequest().to_dict(), **data})
+
+
+def csv_request(row):
+    data = {}
+    bounds = {}
+    for column, value in row.items():
+        value = (value or '').strip()
+        if not value:
+            continue
+        if column == 'knockouts':
+            data['knockouts'] = [gene.strip() for gene in value.split(';') if gene.strip()]
+        elif column == 'fraction':
+            data['fraction'] = float(value)
+        elif column == 'duals':
+            data['duals'] = value.lower() in ('1', 'true', 'yes')
+        elif column in ('method', 'objective'):
+            data[column] = value
+        else: # exchange bounds
+            lb, ub = value.split(':')
+            bounds[column] = (float(lb), float(ub))
+    data['bounds'] = bounds
+    return parse_request(data)
+
+
+def read_requests(path):
+    """
+    (index, request or error message) for each line/row of the input file.
+    """
+    with open(path, newline='') as requests_file:
+        if path.endswith('.csv'):
+            for index, row in enumerate(csv.DictReader(requests_file)):
+                try:
+                    yield index, csv_request(row)
+                except (ValueError, KeyError) as error:
+                    yield index, f'bad row: {error}'
+        else:
+            for index, line in enumerate(requests_file):
+                if not line.strip():
+                    continue
+                try:
+                    yield index, parse_request(json.loads(line))
+                except (ValueError, KeyError, TypeError) as error:
+                    yield index, f'bad line: {error}'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run simulation requests without the game.')
+    parser.add_argument('requests', help='.jsonl or .csv file of requests')
+    parser.add_argument('-o', '--output', help='JSON Lines output (default: stdout)')
+    parser.add_argument('--model', default=DEFAULT_MODEL, help='model name in data/models')
+    parser.add_argument('--processes', type=int, default=None, help='worker processes (default: one per CPU)')
+    parser.add_argument('--fluxes', action='store_true', help='include the non-zero fluxes')
+    parser.add_argument('--compress', action='store_true', help='solve on the compressed model (FBA/FVA values only)')
+    args = parser.parse_args(argv)
+
+    model_path = ModelRegistry().path(args.model)
+    output = open(args.output, 'w') if args.output else sys.stdout
+    requests = []
+    failed = 0
+    try:
+        for index, request in read_requests(args.requests):
+            if isinstance(request, str):
+                failed += 1
+                output.write(json.dumps({'index': index, 'error': request}) + '\n')
+            else:
+                requests.append((index, request))
+
+        with ScreenPool(model_path, args.processes, compress=args.compress) as pool:
+            for record in run_batch(pool, requests, args.fluxes):
+                failed += 'error' in record
+                output.write(json.dumps(record) + '\n')
+                output.flush() # results stream out as they finish
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    return 1 if failed else 0
+
+
+
+if __name__ == '__main__':
+    sys.exit(main())
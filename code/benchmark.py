@@ -0,0 +1,140 @@
+"""
+Timings of the simulation engine per model, method and phase:
+
+    parse       read_sbml_model of the SBML file
+    load_cold   load_model with an empty model cache (parse + pickle write), once
+    load        load_model from the pickle cache
+    session     SimulationSession (simulator, tables, GPR index)
+    reference   wild-type pFBA used by lMOMA/ROOM (once per medium)
+    decode, bounds, genes, cache, solve, extract
+                the phases run_simul records (SimulationResult.timings)
+    total       the whole run_simul call
+    constraints, solve
+                FVA, which the game runs through SimulationSession.fva
+
+Every method runs on the path the game uses (FBA with duals, as the
+Simulation Menu sends it), with the result cache turned off.
+
+    python code/benchmark.py --repeat 5 --models e_coli_core iML1515
+
+Run it from the repository root. Writes one JSON file with every sample
+and min/median/mean/stdev per phase, to compare between releases.
+"""
+import os
+import json
+import time
+import platform
+import argparse
+import statistics
+import tempfile
+from dataclasses import replace
+from cobra.io import read_sbml_model
+from model_cache import load_model
+from model_registry import ModelRegistry
+import simulation
+from simulation import SimulationSession, SimulationRequest, run_simul, request_constraints
+from utils import *
+
+METHODS = ['FBA', 'pFBA', 'lMOMA', 'ROOM', 'FVA'] # every method of the Simulation Menu
+
+
+def timed(samples, phase, func, *args):
+    start = time.perf_counter()
+    value = func(*args)
+    samples.setdefault(phase, []).append(time.perf_counter() - start)
+    return value
+
+
+def apply(session, request):
+    constraints = request_constraints(request, session)
+    session.set_bounds(constraints)
+    return constraints
+
+
+def stats(samples):
+    return {'runs': len(samples),
+            'min': min(samples),
+            'median': statistics.median(samples),
+            'mean': statistics.mean(samples),
+            'stdev': statistics.stdev(samples) if len(samples) > 1 else 0.0,
+            'samples': samples}
+
+
+def bench_model(model_path, methods, repeat):
+    """
+    {phase: [seconds]} for loading, and {method: {phase: [seconds]}}.
+    Runs alternate between the default medium and a single knockout, so
+    bounds really change between runs. The result cache is off, every run
+    is solved.
+    """
+    loading = {}
+    with tempfile.TemporaryDirectory() as cold_folder: # cold cache, kept apart from the warm samples
+        timed(loading, 'load_cold', load_model, model_path, cold_folder)
+    load_model(model_path) # make sure the real cache is warm
+    for _ in range(repeat):
+        timed(loading, 'parse', read_sbml_model, model_path)
+        model, model_key = timed(loading, 'load', load_model, model_path)
+        session = timed(loading, 'session', SimulationSession, model, model_key)
+
+    session.cache.max_size = 0 # nothing is remembered...
+    session.cache.disk = False # ...or written
+    gene = next(iter(session.genes.index), None)
+    requests = [SimulationRequest(), SimulationRequest(knockouts=(gene,) if gene else ())]
+
+    runs = {}
+    for method in methods:
+        samples = runs[method] = {}
+        session.reset()
+        if method in ('lMOMA', 'ROOM'):
+            timed(samples, 'reference', session.reference, {})
+        for i in range(repeat):
+            request = replace(requests[i % 2], method=method, duals=method == 'FBA')
+            if method == 'FVA':
+                constraints = timed(samples, 'constraints', apply, session, request)
+                timed(samples, 'solve', session.fva, constraints, session.exchange_ids, request.fraction)
+                continue
+            result = timed(samples, 'total', run_simul, request, session)
+            for phase, seconds in result.timings.items():
+                samples.setdefault(phase, []).append(seconds)
+    session.reset()
+    return loading, runs
+
+
+def main(argv=None):
+    registry = ModelRegistry()
+    parser = argparse.ArgumentParser(description='Benchmark the simulation engine.')
+    parser.add_argument('--models', nargs='+', default=registry.available())
+    parser.add_argument('--methods', nargs='+', default=METHODS, choices=METHODS)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('-o', '--output', default=None, help='JSON file (default: code/player_history/benchmarks/<time>.json)')
+    args = parser.parse_args(argv)
+    simulation.TIMING_LOG = False # benchmark runs are not player sessions
+
+    report = {'meta': {'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                       'python': platform.python_version(),
+                       'platform': platform.platform(),
+                       'repeat': args.repeat},
+              'results': []}
+
+    for name in args.models:
+        model_path = registry.path(name)
+        loading, runs = bench_model(model_path, args.methods, args.repeat)
+        report['meta'].setdefault('models', {})[name] = file_hash(model_path)
+        for phase, samples in loading.items():
+            report['results'].append({'model': name, 'method': None, 'phase': phase, **stats(samples)})
+            print(f'{name:12} {"":6} {phase:12} median {statistics.median(samples) * 1000:9.2f} ms')
+        for method, phases in runs.items():
+            for phase, samples in phases.items():
+                report['results'].append({'model': name, 'method': method, 'phase': phase, **stats(samples)})
+                print(f'{name:12} {method:6} {phase:12} median {statistics.median(samples) * 1000:9.2f} ms')
+
+    output = args.output or get_resource_path(f'code/player_history/benchmarks/{time.strftime("%Y%m%d-%H%M%S")}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as report_file:
+        json.dump(report, report_file, indent=1)
+    print(output)
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+import os
+import json
+import math
+import threading
+from cobra.flux_analysis import find_blocked_reactions
+from utils import *
+
+_blocked_lock = threading.Lock() # the essential-gene thread and the game may ask at once
+
+
+def blocked_reactions(model, model_key, folder='code/player_history/compressed'):
+    """
+    Reactions that carry no flux even with every exchange open, so they
+    are blocked in any medium the game can set. Solved once per model
+    (one FVA) and kept on disk by model key.
+    """
+    path = os.path.join(get_resource_path(folder), f'{model_key[:16]}.json')
+    with _blocked_lock:
+        try:
+            with open(path) as blocked_file:
+                return set(json.load(blocked_file))
+        except (FileNotFoundError, ValueError):
+            pass
+
+        blocked = find_blocked_reactions(model, open_exchanges=True)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f'{path}.{os.getpid()}.tmp' # other processes may write it at the same time
+            with open(tmp_path, 'w') as blocked_file:
+                json.dump(sorted(blocked), blocked_file)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+        return set(blocked)
+
+
+class CompressedModel:
+    """
+    Smaller copy of a model to solve repeated LPs on: blocked reactions are
+    removed and linear chains (a metabolite used by exactly two reactions)
+    are merged into one reaction. Each original reaction keeps a
+    representative and a factor (v_original = factor * v_representative)
+    so bounds, objectives and fluxes translate both ways.
+    Exchanges, the objective and reactions whose bounds exclude zero are
+    never merged, so every bound the game can set stays satisfiable.
+    """
+
+    def __init__(self, model, model_key):
+        self.bounds = {r.id: r.bounds for r in model.reactions} # original defaults
+        self.blocked = blocked_reactions(model, model_key)
+
+        self.model = model.copy()
+        self.model.remove_reactions([self.model.reactions.get_by_id(r_id) for r_id in self.blocked], remove_orphans=True)
+
+        self.owner = {r.id: (r.id, 1.0) for r in self.model.reactions} # original -> (representative, factor)
+        self.members = {r.id: [(r.id, 1.0)] for r in self.model.reactions} # representative -> [(original, factor)]
+
+        objective = {r.id for r in self.model.reactions if r.objective_coefficient != 0}
+        self.protected = {r.id for r in self.model.boundary} | objective
+        self.protected |= {r.id for r in self.model.reactions if r.lower_bound > 0 or r.upper_bound < 0}
+        self._merge_chains()
+
+
+    def _merge_chains(self):
+        merged = True
+        while merged:
+            merged = False
+            for metabolite in list(self.model.metabolites):
+                reactions = list(metabolite.reactions)
+                if len(reactions) != 2 or any(r.id in self.protected for r in reactions):
+                    continue
+                if self._merge(metabolite, *reactions):
+                    merged = True
+
+
+    def _merge(self, metabolite, keep, drop):
+        # steady state on the metabolite: a * v_keep + b * v_drop = 0
+        a = keep.metabolites[metabolite]
+        b = drop.metabolites[metabolite]
+        k = -a / b # v_drop = k * v_keep
+
+        lo, hi = drop.lower_bound / k, drop.upper_bound / k
+        if k < 0:
+            lo, hi = hi, lo
+        lb, ub = max(keep.lower_bound, lo), min(keep.upper_bound, hi)
+        if lb > ub:
+            return False
+
+        changes = {met: k * coef for met, coef in drop.metabolites.items() if met is not metabolite}
+        changes[metabolite] = -a # cancels exactly, so cobra drops it from the reaction
+        keep.add_metabolites(changes, combine=True)
+        keep.bounds = (lb, ub)
+
+        for original, factor in self.members.pop(drop.id):
+            self.owner[original] = (keep.id, factor * k)
+            self.members[keep.id].append((original, factor * k))
+        self.model.remove_reactions([drop], remove_orphans=True)
+        return True
+
+
+    def translate(self, constraints):
+        """
+        Bounds on original reactions -> bounds on the representatives.
+        Blocked reactions carry no flux anyway and are skipped.
+        """
+        changed = {}
+        for r_id, bounds in constraints.items():
+            if r_id in self.blocked:
+                continue
+            representative, _ = self.owner[r_id]
+            changed.setdefault(representative, {})[r_id] = bounds
+
+        translated = {}
+        for representative, members_bounds in changed.items():
+            lb, ub = -math.inf, math.inf
+            for original, factor in self.members[representative]:
+                low, high = members_bounds.get(original, self.bounds[original])
+                low, high = low / factor, high / factor
+                if factor < 0:
+                    low, high = high, low
+                lb, ub = max(lb, low), min(ub, high)
+            translated[representative] = (lb, ub)
+        return translated
+
+
+    def objective(self, r_id):
+        # maximising v_original is maximising factor * v_representative
+        if r_id in self.blocked:
+            raise ValueError(f'{r_id} is blocked in every medium, use an uncompressed session')
+        representative, factor = self.owner[r_id]
+        return {representative: factor}
+
+
+    def expand(self, fluxes):
+        """
+        Fluxes of the representatives -> fluxes of every original reaction.
+        """
+        full = {r_id: 0.0 for r_id in self.blocked}
+        for representative, value in fluxes.items():
+            for original, factor in self.members[representative]:
+                full[original] = factor * value
+        return full
+
+
+    def expand_ranges(self, ranges):
+        full = {r_id: [0.0, 0.0] for r_id in self.blocked}
+        for representative, (low, high) in ranges.items():
+            for original, factor in self.members[representative]:
+                values = sorted((factor * low, factor * high))
+                full[original] = values
+        return full
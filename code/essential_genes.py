@@ -0,0 +1,62 @@
+import os
+import json
+from screening import ScreenPool, screen_genes, wild_type, growth_value
+from simulation import SimulationRequest
+from utils import *
+
+
+ESSENTIAL_FOLDER = 'code/player_history/essential'
+
+
+def read_essential(model_key, threshold=0.01, folder=ESSENTIAL_FOLDER):
+    """
+    The essential-gene set saved for this model, or None if it was never
+    screened. Only reads a file.
+    """
+    path = os.path.join(get_resource_path(folder), f'{model_key[:16]}.json')
+    try:
+        with open(path) as essential_file:
+            data = json.load(essential_file)
+        if data['threshold'] == threshold:
+            return frozenset(data['genes'])
+    except (FileNotFoundError, ValueError, KeyError):
+        pass
+    return None
+
+
+def essential_genes(session, model_path, threshold=0.01, processes=None, folder=ESSENTIAL_FOLDER):
+    """
+    Genes whose knockout alone leaves less than `threshold` of the wild-type
+    growth in the default medium. Screened once per model over a worker pool
+    and kept on disk by model hash, so later loads only read a file.
+    """
+    essential = read_essential(session.model_key, threshold, folder)
+    if essential is not None:
+        return essential
+
+    path = os.path.join(get_resource_path(folder), f'{session.model_key[:16]}.json')
+    base = SimulationRequest()
+    growth, _ = wild_type(session, base)
+    with ScreenPool(model_path, processes, compress=True, session=session) as pool:
+        essential = sorted(gene for gene, result in screen_genes(pool, list(session.genes.index), base)
+                           if growth_value(result) < threshold * growth)
+    session.reset()
+
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as essential_file:
+            json.dump({'threshold': threshold, 'growth': growth, 'genes': essential}, essential_file)
+        os.replace(tmp_path, path)
+    except OSError:
+        pass
+    return frozenset(essential)
+
+
+
+if __name__ == '__main__':
+    from model_cache import load_model
+    from simulation import SimulationSession
+    model_path = get_resource_path('data/models/e_coli_core.xml.gz')
+    session = SimulationSession(*load_model(model_path))
+    print(sorted(essential_genes(session, model_path)))
@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import numpy as np
+from utils import *
+
+
+class FluxHistory:
+    """
+    Full flux vector of every run, stored per model as float32 matrices of
+    `chunk_size` rows (one row per run, columns follow reactions.json) plus
+    a runs.jsonl line with what was simulated. Chunks are memory-mapped on
+    read, so comparing many runs never builds python dicts.
+
+    A run's row is written to its chunk before its runs.jsonl line, so
+    runs.jsonl is the record of what was saved: rows past it, or a torn
+    last line, are dropped on the next load. Like ResultCache, failed
+    writes are skipped, the game keeps going without history.
+    """
+
+    def __init__(self, model_key, reactions, chunk_size=64, folder='code/player_history/fluxes'):
+        self.folder = get_resource_path(os.path.join(folder, model_key[:16]))
+        self.reactions = list(reactions)
+        self.chunk_size = chunk_size
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            index_path = os.path.join(self.folder, 'reactions.json')
+            if not os.path.exists(index_path):
+                with open(index_path, 'w') as index_file:
+                    json.dump(self.reactions, index_file)
+        except OSError: # read-only install, appends are skipped too
+            pass
+
+        self.count = len(self._recover())
+        # rows of the last, unfinished chunk, without any row past runs.jsonl
+        last = self._chunk_path(self.count // self.chunk_size)
+        rows = self.count % self.chunk_size
+        self.pending = list(np.load(last)[:rows]) if rows and os.path.exists(last) else []
+
+
+    def _chunk_path(self, number):
+        return os.path.join(self.folder, f'chunk_{number:05d}.npy')
+
+
+    def _read_runs(self):
+        # complete records of runs.jsonl, up to a torn line, and the lines read
+        try:
+            with open(os.path.join(self.folder, 'runs.jsonl')) as runs_file:
+                lines = runs_file.readlines()
+        except OSError:
+            return [], []
+        runs = []
+        for line in lines:
+            if not line.endswith('\n'):
+                break
+            try:
+                runs.append(json.loads(line))
+            except ValueError:
+                break
+        return runs, lines
+
+
+    def _recover(self):
+        # drops a torn last line of runs.jsonl (interrupted append), returns the runs
+        path = os.path.join(self.folder, 'runs.jsonl')
+        runs, lines = self._read_runs()
+        if len(runs) < len(lines):
+            try:
+                with open(path, 'w') as runs_file:
+                    runs_file.writelines(json.dumps(run) + '\n' for run in runs)
+            except OSError:
+                pass
+        return runs
+
+
+    def append(self, request, result):
+        """
+        Saves one run. Returns False when it could not be written.
+        """
+        self.pending.append(np.asarray(result.fluxes, dtype=np.float32))
+        record = {'run': self.count, 'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+                  'method': request.method, 'objective': result.objective,
+                  'status': result.status.value, 'value': result.objective_value,
+                  'knockouts': list(request.knockouts)}
+        path = self._chunk_path(self.count // self.chunk_size)
+        runs_path = os.path.join(self.folder, 'runs.jsonl')
+        size = None
+        try:
+            # chunk first, replaced whole, then the line that makes the row count
+            with open(path + '.tmp', 'wb') as chunk_file:
+                np.save(chunk_file, np.vstack(self.pending))
+            os.replace(path + '.tmp', path)
+            with open(runs_path, 'a') as runs_file:
+                size = runs_file.tell()
+                runs_file.write(json.dumps(record) + '\n')
+        except OSError:
+            self.pending.pop()
+            if size is not None: # no torn line for the next append to glue onto
+                try:
+                    os.truncate(runs_path, size)
+                except OSError:
+                    pass
+            return False
+
+        self.count += 1
+        if len(self.pending) == self.chunk_size:
+            self.pending = []
+        return True
+
+
+    def runs(self):
+        return self._read_runs()[0][:self.count]
+
+
+    def chunks(self):
+        # memory-mapped float32 matrices, oldest runs first
+        for number in range(-(-self.count // self.chunk_size)):
+            rows = min(self.chunk_size, self.count - number * self.chunk_size)
+            yield np.load(self._chunk_path(number), mmap_mode='r')[:rows]
+
+
+    def fluxes(self, runs=None):
+        """
+        (runs x reactions) matrix of the chosen run numbers (all if None).
+        """
+        if runs is None:
+            return np.vstack(list(self.chunks())) if self.count else np.empty((0, len(self.reactions)), np.float32)
+        rows = []
+        for run in runs:
+            chunk = np.load(self._chunk_path(run // self.chunk_size), mmap_mode='r')
+            rows.append(chunk[run % self.chunk_size])
+        return np.vstack(rows)
+
+
+    def reaction(self, r_id):
+        # flux of one reaction across every run
+        column = self.reactions.index(r_id)
+        return np.concatenate([chunk[:, column] for chunk in self.chunks()]) if self.count else np.empty(0, np.float32)
@@ -1,5 +1,8 @@
 import pygame
+import multiprocessing
+import numpy as np
 from settings import *
+from button import Button
 from os import walk
 
 def import_folder(path):
@@ -56,3 +59,141 @@ def animation_text_save(text, time=1200, fullscreen=False):
                 sceneExit = True
 
 
+def wait_simulation(worker, ticket, text='Running'):
+        """
+        Keeps drawing the elapsed time and a Cancel button (or ESC) until the
+        worker answers the ticket. Returns the answer, or None if cancelled.
+        """
+        display_surface = pygame.display.get_surface()
+        background = display_surface.copy()
+        font_path = get_resource_path('font/LycheeSoda.ttf')
+        font = pygame.font.Font(font_path, 30)
+        clock = pygame.time.Clock()
+
+        cancelled = []
+        cancel_button = Button(515, SCREEN_HEIGHT-130, 250, 50, display_surface, 'Cancel', lambda: cancelled.append(True), bg_color=(70, 70, 70), font_color='white')
+
+        while True:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    pygame.event.post(event) # let the game loop save and quit
+                    cancelled.append(True)
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+                    cancelled.append(True)
+
+            if cancelled:
+                worker.cancel()
+                return None
+
+            answer = worker.poll(ticket)
+            if answer is not None:
+                return answer
+
+            display_surface.blit(background, (0, 0))
+            text_surf = font.render(f'{text} ... {worker.elapsed(ticket):.1f} s', False, 'black')
+            text_rect = text_surf.get_rect(midbottom = (SCREEN_WIDTH/2, SCREEN_HEIGHT-20))
+            pygame.draw.rect(display_surface, 'white', text_rect.inflate(10,10),0,2)
+            display_surface.blit(text_surf, text_rect)
+            cancel_button.process()
+
+            pygame.display.update()
+            clock.tick(30)
+
+
+def wait_screen(results, total, cancel, text='Screening'):
+        """
+        Collects the results of a parallel screen as they arrive, drawing
+        how many are done. Returns ('done', list), ('cancelled', None) or
+        ('error', message); cancel() is called on both of the latter.
+        """
+        display_surface = pygame.display.get_surface()
+        background = display_surface.copy()
+        font_path = get_resource_path('font/LycheeSoda.ttf')
+        font = pygame.font.Font(font_path, 30)
+        clock = pygame.time.Clock()
+
+        done = []
+        cancelled = []
+        cancel_button = Button(515, SCREEN_HEIGHT-130, 250, 50, display_surface, 'Cancel', lambda: cancelled.append(True), bg_color=(70, 70, 70), font_color='white')
+
+        while True:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    pygame.event.post(event)
+                    cancelled.append(True)
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+                    cancelled.append(True)
+
+            if cancelled:
+                cancel()
+                return 'cancelled', None
+
+            try:
+                done.append(results.next(timeout=0.02))
+            except multiprocessing.TimeoutError:
+                pass
+            except StopIteration:
+                return 'done', done
+            except Exception as error: # raised by a worker task
+                cancel()
+                return 'error', f'{type(error).__name__}: {error}'
+
+            display_surface.blit(background, (0, 0))
+            text_surf = font.render(f'{text} ... {len(done)}/{total}', False, 'black')
+            text_rect = text_surf.get_rect(midbottom = (SCREEN_WIDTH/2, SCREEN_HEIGHT-20))
+            pygame.draw.rect(display_surface, 'white', text_rect.inflate(10,10),0,2)
+            display_surface.blit(text_surf, text_rect)
+            cancel_button.process()
+
+            pygame.display.update()
+            clock.tick(30)
+
+
+def wait_loading(preloader, text='Loading model'):
+        """
+        Shown only if the player reaches the desk before the background
+        model loading is done.
+        """
+        display_surface = pygame.display.get_surface()
+        background = display_surface.copy()
+        font_path = get_resource_path('font/LycheeSoda.ttf')
+        font = pygame.font.Font(font_path, 30)
+        clock = pygame.time.Clock()
+        quit_events = []
+
+        while not preloader.ready:
+            quit_events += pygame.event.get(pygame.QUIT)
+            pygame.event.pump()
+
+            display_surface.blit(background, (0, 0))
+            text_surf = font.render(f'{text} ({preloader.step}) ... {preloader.elapsed():.1f} s', False, 'black')
+            text_rect = text_surf.get_rect(midbottom = (SCREEN_WIDTH/2, SCREEN_HEIGHT-20))
+            pygame.draw.rect(display_surface, 'white', text_rect.inflate(10,10),0,2)
+            display_surface.blit(text_surf, text_rect)
+
+            pygame.display.update()
+            clock.tick(30)
+
+        for event in quit_events: # handled by the game loop once we are back
+            pygame.event.post(event)
+
+
+def heatmap_surface(grid, size=(640, 400)):
+        """
+        Surface of a sweep grid indexed [y, x]: dark for no growth up to
+        green for the highest value, grey where a point was not solved.
+        The first row is drawn at the bottom, so y grows upwards.
+        """
+        grid = np.asarray(grid, dtype=float)
+        solved = ~np.isnan(grid)
+        top = grid[solved].max() if solved.any() else 0
+        scaled = np.clip(np.where(solved, grid, 0) / (top if top > 0 else 1), 0, 1)
+
+        pixels = np.zeros(grid.shape + (3,), dtype=np.uint8)
+        pixels[..., 0] = 20 + scaled * 30
+        pixels[..., 1] = 20 + scaled * 200
+        pixels[..., 2] = 40 + scaled * 40
+        pixels[~solved] = (150, 150, 150)
+
+        surface = pygame.surfarray.make_surface(np.flipud(pixels).swapaxes(0, 1))
+        return pygame.transform.scale(surface, size)
@@ -0,0 +1,82 @@
+import re
+
+_TOKENS = re.compile(r'\(|\)|[^\s()]+')
+
+
+def parse_gpr(rule):
+    """
+    Compile a gene-protein-reaction rule like 'b0001 and (b0002 or b0003)'
+    into nested tuples: ('and', [...]), ('or', [...]) or a gene id.
+    'and' binds tighter than 'or', as in the SBML files.
+    """
+    tokens = _TOKENS.findall(rule)
+    pos = 0
+
+    def parse_or():
+        nonlocal pos
+        terms = [parse_and()]
+        while pos < len(tokens) and tokens[pos].lower() == 'or':
+            pos += 1
+            terms.append(parse_and())
+        return terms[0] if len(terms) == 1 else ('or', terms)
+
+    def parse_and():
+        nonlocal pos
+        terms = [parse_atom()]
+        while pos < len(tokens) and tokens[pos].lower() == 'and':
+            pos += 1
+            terms.append(parse_atom())
+        return terms[0] if len(terms) == 1 else ('and', terms)
+
+    def parse_atom():
+        nonlocal pos
+        token = tokens[pos]
+        pos += 1
+        if token == '(':
+            node = parse_or()
+            pos += 1 # closing bracket
+            return node
+        return token
+
+    return parse_or()
+
+
+def gpr_genes(node):
+    if isinstance(node, str):
+        return {node}
+    return set().union(*(gpr_genes(term) for term in node[1]))
+
+
+def gpr_active(node, knocked_out):
+    """ True if the reaction still has a working enzyme without the knocked out genes"""
+    if isinstance(node, str):
+        return node not in knocked_out
+    if node[0] == 'and':
+        return all(gpr_active(term, knocked_out) for term in node[1])
+    return any(gpr_active(term, knocked_out) for term in node[1])
+
+
+class KnockoutIndex:
+    """
+    GPR rules of every reaction, compiled once when the model is loaded.
+    A set of knocked out genes only re-evaluates the rules that mention them.
+    """
+
+    def __init__(self, model):
+        self.rules = {} # reaction id -> compiled rule
+        self.gene_reactions = {} # gene id -> reactions whose rule mentions it
+
+        for reaction in model.reactions:
+            rule = reaction.gene_reaction_rule
+            if not rule.strip():
+                continue
+            node = parse_gpr(rule)
+            self.rules[reaction.id] = node
+            for gene in gpr_genes(node):
+                self.gene_reactions.setdefault(gene, []).append(reaction.id)
+
+
+    def deleted_reactions(self, genes):
+        knocked_out = set(genes)
+        candidates = {r_id for gene in knocked_out for r_id in self.gene_reactions.get(gene, ())}
+        return sorted(r_id for r_id in candidates if not gpr_active(self.rules[r_id], knocked_out))
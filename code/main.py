@@ -1,4 +1,5 @@
 import pygame, sys, os
+import multiprocessing
 from settings import *
 from level import Level
 from intro import Intro
@@ -61,4 +62,5 @@ class Game:
 			pygame.display.update()
 	
 if __name__ == '__main__':
+	multiprocessing.freeze_support() # simulations run in a worker process
 	game = Game()
\ No newline at end of file
@@ -249,7 +249,9 @@ class Mission02_info:
         # print(ans)
         right = self.check_results(ans)
 
-        if right:
+        if right is None:
+            animation_text_save('Dr. Silva is still checking the genes, try again soon!', time=2000)
+        elif right:
             self.success.play()
             self.missions_completed.insert(0, '02')
             animation_text_save('Congratulations! Mission Completed!', time=2000)
@@ -259,7 +261,13 @@ class Mission02_info:
 
 
     def check_results(self, ans):
-        if ans == 'b2926':
+        # one of the listed genes, essential in the default model (screened once at load);
+        # None while that screen has not finished
+        genes_02 = ['b1241','b3115','b3736','b2975','b1524','b2278','b2926','b2297','b0728','b3919']
+        essential = registry.essential(DEFAULT_MODEL)
+        if essential is None:
+            return None
+        if ans in genes_02 and ans in essential:
             return True
         else:
             return False
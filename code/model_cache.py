@@ -0,0 +1,38 @@
+import os
+import pickle
+from cobra.io import read_sbml_model
+from utils import *
+
+
+def load_model(model_path, folder='code/player_history/models'):
+    """
+    read_sbml_model with a binary cache: the parsed model is pickled under
+    the sha256 of the SBML file, so a changed file is parsed again.
+    Returns the model and that hash (the model key used by the caches).
+    """
+    digest = file_hash(model_path)
+    folder = get_resource_path(folder)
+    name = os.path.basename(model_path).split('.')[0]
+    cached = os.path.join(folder, f'{name}-{digest[:16]}.pickle')
+
+    try:
+        with open(cached, 'rb') as cache_file:
+            return pickle.load(cache_file), digest
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        pass # missing, or written by another cobra version
+
+    model = read_sbml_model(model_path)
+
+    try:
+        os.makedirs(folder, exist_ok=True)
+        for old in os.listdir(folder): # older versions of the same model
+            if old.startswith(f'{name}-') and old.endswith('.pickle') and old != os.path.basename(cached):
+                os.remove(os.path.join(folder, old))
+        temp = f'{cached}.{os.getpid()}.tmp' # pool workers may all be writing it
+        with open(temp, 'wb') as cache_file:
+            pickle.dump(model, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp, cached) # never leave half a file behind
+    except OSError:
+        pass
+
+    return model, digest
@@ -0,0 +1,96 @@
+import os
+import threading
+from collections import OrderedDict
+from model_cache import load_model
+from simulation import SimulationSession
+from essential_genes import essential_genes, read_essential
+from utils import *
+
+MODELS_FOLDER = 'data/models'
+DEFAULT_MODEL = 'e_coli_core'
+
+
+class ModelRegistry:
+    """
+    Every model shipped in data/models, loaded on demand. Each one gets its
+    own SimulationSession (simulator, GPR index, result cache). The most
+    recently used `max_models` stay warm in memory; older ones are evicted
+    and loaded again (from the model cache) if asked for later.
+    With essentials=True each session also gets its essential-gene set,
+    read from disk or screened on a background thread (session.essential
+    stays None meanwhile).
+    """
+
+    def __init__(self, max_models=2, folder=MODELS_FOLDER, essentials=False):
+        self.max_models = max_models
+        self.essentials = essentials
+        self._screening = set() # models whose essential genes are being screened
+        self.folder = get_resource_path(folder)
+        self.sessions = OrderedDict()
+        self._lock = threading.Lock() # the preloader thread and the game may ask at once
+
+
+    def available(self):
+        names = []
+        for file_name in sorted(os.listdir(self.folder)):
+            if file_name.endswith('.xml') or file_name.endswith('.xml.gz'):
+                names.append(file_name.split('.')[0])
+        return names
+
+
+    def path(self, name):
+        for extension in ('.xml.gz', '.xml'):
+            path = os.path.join(self.folder, name + extension)
+            if os.path.exists(path):
+                return path
+        raise KeyError(f'no model {name} in {self.folder}')
+
+
+    def is_loaded(self, name):
+        return name in self.sessions
+
+
+    def get(self, name=DEFAULT_MODEL):
+        with self._lock:
+            if name in self.sessions:
+                self.sessions.move_to_end(name)
+                return self.sessions[name]
+
+            model, model_key = load_model(self.path(name))
+            session = SimulationSession(model, model_key)
+            self.sessions[name] = session
+            while len(self.sessions) > self.max_models:
+                self.sessions.popitem(last=False)
+
+            if self.essentials:
+                session.essential = read_essential(session.model_key)
+                if session.essential is None and name not in self._screening:
+                    # first load of this model: screen outside the lock, nobody waits for it
+                    self._screening.add(name)
+                    threading.Thread(target=self._screen_essential, args=(name, session), daemon=True).start()
+            return session
+
+
+    def _screen_essential(self, name, session):
+        try:
+            # a session of its own: the game keeps using (and solving on) `session` meanwhile
+            screening_session = SimulationSession(*load_model(self.path(name)))
+            session.essential = essential_genes(screening_session, self.path(name))
+        finally:
+            self._screening.discard(name)
+
+
+    def essential(self, name=DEFAULT_MODEL):
+        """
+        Essential genes of a model without loading or screening it: from its
+        session or from disk; None while they are not known yet.
+        """
+        session = self.sessions.get(name)
+        if session is not None and session.essential is not None:
+            return session.essential
+        return read_essential(file_hash(self.path(name)))
+
+
+    def evict(self, name):
+        with self._lock:
+            self.sessions.pop(name, None)
@@ -3,7 +3,8 @@ from mewpy.simulation import get_simulator
 import pygame_menu
 from save_load import *
 from utils import *
-from cobra.io import read_sbml_model
+from preloader import ModelPreloader
+from model_registry import ModelRegistry, DEFAULT_MODEL
 
 mytheme = pygame_menu.themes.THEME_GREEN.copy() #(186,214,177)
 font = pygame_menu.font.FONT_MUNRO
@@ -21,25 +22,20 @@ tutorial_theme = mytheme.copy()
 tutorial_theme.background_color = (255,215,0, 255)
 
 
-model_path = get_resource_path('data/models/e_coli_core.xml.gz') #('.../data/models/iMM904.xml.gz') #('../data/models/e_coli_core.xml.gz')
-model = read_sbml_model(model_path) 
-simul = get_simulator(model)
-objective = list(simul.objective.keys())[0]
-
-# METABOLITES = simul.find_metabolites() # dataframe
-# COMPARTMENTS = simul.compartments # dicionario
-REACTIONS_v0 = simul.find_reactions()
-REACTIONS = simul.find_reactions('EX') # dataframe
-
-GENES_v0 = simul.find_genes().name # dataframe
-GENES = [name for (name, _) in GENES_v0.items()]
+# every model in data/models (e_coli_core, iML1515, iMM904), each with its own session
+registry = ModelRegistry(max_models=2, essentials=True)
+# the default model loads in the background from the moment the game starts;
+# preloader.get() returns its SimulationSession (waiting only if it is not ready yet)
+preloader = ModelPreloader(registry, DEFAULT_MODEL)
 
 
 if __name__ == '__main__': # tests
     
-    print(GENES)
-    # print(REACTIONS)
-    print(REACTIONS_v0)
+    session = preloader.get()
+    simul = session.simul
+    print(list(session.genes.index))
+    # print(session.exchanges)
+    print(simul.find_reactions())
     print(simul.find_reactions('EX_etoh_e'))
     # print(simul.essential_genes())
     # print(simul.find_genes().reactions)
@@ -0,0 +1,61 @@
+import time
+import threading
+import multiprocessing
+
+
+class ModelPreloader:
+    """
+    Loads a model of the registry and builds its SimulationSession on a
+    background thread as soon as it is created, so the game keeps running
+    meanwhile. `step` says what it is doing, for the loading indicator.
+    With start=False nothing runs until get(), which then loads in place.
+    By default it only starts in the main process: spawned workers import
+    the game modules too, and they load their own model.
+    """
+
+    def __init__(self, registry, name, start=None):
+        if start is None:
+            start = multiprocessing.parent_process() is None
+        self.registry = registry
+        self.name = name
+        self.session = None
+        self.error = None
+        self.step = 'starting'
+        self.started = time.perf_counter()
+
+        self._done = threading.Event()
+        self._thread = None
+        if start:
+            self._thread = threading.Thread(target=self._load, daemon=True)
+            self._thread.start()
+
+
+    def _load(self):
+        try:
+            self.step = self.name
+            self.session = self.registry.get(self.name)
+        except Exception as error:
+            self.error = error
+        finally:
+            self._done.set()
+
+
+    @property
+    def ready(self):
+        return self._done.is_set()
+
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+    def get(self):
+        """
+        The loaded session; blocks until loading finishes.
+        """
+        if self._thread is None and not self._done.is_set():
+            self._load()
+        self._done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.session
@@ -0,0 +1,111 @@
+import os
+import json
+import hashlib
+from collections import OrderedDict
+from utils import *
+
+CACHE_VERSION = 2 # bump when the stored result format changes
+
+
+def cache_key(model_key, method, objective, constraints):
+    """
+    Canonical hash of one simulation: same model, method, objective and
+    effective bounds always give the same key, whatever the dict order.
+    """
+    bounds = sorted((r_id, float(lb), float(ub)) for r_id, (lb, ub) in constraints.items())
+    payload = json.dumps([CACHE_VERSION, model_key, method, objective, bounds], separators=(',', ':'))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    Two tier cache of simulation results: an in-memory LRU and one json file
+    per result under player_history/cache, so repeated runs survive restarts.
+    The disk tier keeps at most max_files results, dropping the least
+    recently used ones; disk=False keeps only the memory tier.
+    """
+
+    def __init__(self, max_size=256, folder='code/player_history/cache', max_files=2000, disk=True):
+        self.max_size = max_size
+        self.max_files = max_files
+        self.disk = disk
+        self.folder = get_resource_path(folder)
+        self.memory = OrderedDict()
+        self._writes = 0 # the folder is trimmed every so many writes, not on each one
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+
+    def get(self, key):
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.hits += 1
+            return self.memory[key]
+
+        path = os.path.join(self.folder, f'{key}.json')
+        try:
+            with open(path) as cache_file:
+                value = json.load(cache_file)
+            os.utime(path) # recently used, last to be trimmed
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+        self._remember(key, value)
+        self.hits += 1
+        self.disk_hits += 1
+        return value
+
+
+    def put(self, key, value):
+        self._remember(key, value)
+        if not self.disk:
+            return
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            with open(os.path.join(self.folder, f'{key}.json'), 'w') as cache_file:
+                json.dump(value, cache_file)
+        except OSError: # a read-only install still gets the memory tier
+            return
+
+        self._writes += 1
+        if self._writes % 64 == 0:
+            self._trim()
+
+
+    def _trim(self):
+        files = []
+        for name in os.listdir(self.folder):
+            if name.endswith('.json'):
+                path = os.path.join(self.folder, name)
+                try:
+                    files.append((os.path.getmtime(path), path))
+                except OSError: # removed by another process meanwhile
+                    pass
+        files.sort()
+        for _, path in files[:max(len(files) - self.max_files, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+    def _remember(self, key, value):
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_size:
+            self.memory.popitem(last=False)
+
+
+    def clear(self):
+        self.memory.clear()
+        if os.path.isdir(self.folder):
+            for name in os.listdir(self.folder):
+                if name.endswith('.json'):
+                    os.remove(os.path.join(self.folder, name))
+
+
+    def stats(self):
+        return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses, 'size': len(self.memory)}
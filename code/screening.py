@@ -0,0 +1,361 @@
+import os
+import json
+import math
+import itertools
+import multiprocessing
+import numpy as np
+from dataclasses import replace
+from model_cache import load_model
+from compression import blocked_reactions
+from result_cache import cache_key
+import simulation
+from simulation import SimulationSession, SimulationRequest, run_simul, request_constraints
+from utils import *
+
+_session = None # warm session of this worker process
+
+
+def _init_worker(model_path, compress=False):
+    global _session
+    simulation.TIMING_LOG = False # thousands of runs, many processes: not for the rolling log
+    model, model_key = load_model(model_path)
+    _session = SimulationSession(model, model_key, compress)
+    _session.cache.disk = False # screens and sweeps would fill player_history/cache
+
+
+def _knockout(task):
+    base, gene = task
+    request = replace(base, knockouts=tuple(base.knockouts) + (gene,))
+    return gene, run_simul(request, _session).summary()
+
+
+def _pair(task):
+    base, pair = task
+    request = replace(base, knockouts=tuple(base.knockouts) + tuple(pair))
+    return pair, run_simul(request, _session).summary()
+
+
+def _substitute(task):
+    base, remove, candidate, uptake = task
+    bounds = dict(base.bounds)
+    _, ub = bounds.get(remove, _session.default_bounds(remove))
+    bounds[remove] = (0, ub) # no more uptake of the original carbon source
+    _, ub = bounds.get(candidate, _session.default_bounds(candidate))
+    bounds[candidate] = (uptake, ub)
+    return candidate, run_simul(replace(base, bounds=bounds), _session).summary()
+
+
+def _sweep_row(task):
+    base, x_id, x_uptakes, y_id, y_uptake, row = task
+    if y_id:
+        bounds = dict(base.bounds)
+        _, ub = bounds.get(y_id, _session.default_bounds(y_id))
+        bounds[y_id] = (-y_uptake, ub)
+        base = replace(base, bounds=bounds)
+    return row, sweep_line(_session, base, x_id, x_uptakes)
+
+
+def _run(task):
+    index, request, fluxes = task
+    try:
+        if request.method == 'FVA':
+            return _run_fva(index, request)
+        result = run_simul(request, _session)
+    except Exception as error: # one bad request (unknown gene, objective ...) must not stop a batch
+        return {'index': index, 'error': f'{type(error).__name__}: {error}'}
+    record = {'index': index,
+              'objective': result.objective,
+              'status': result.status.value,
+              'objective_value': None if math.isnan(result.objective_value) else result.objective_value,
+              'value': result.value(),
+              'timings': result.timings}
+    if fluxes and result.status.value == 'OPTIMAL':
+        record['fluxes'] = {r_id: v for r_id, v in zip(result.reactions, result.fluxes.tolist()) if abs(v) > 1e-9}
+    if result.reduced_costs is not None:
+        record['shadow_prices'] = result.shadow_prices
+        record['reduced_costs'] = result.reduced_costs
+    return record
+
+
+def _run_fva(index, request):
+    # like the game's FVA: range of every exchange at request.fraction of the optimum
+    objective = request.objective or _session.default_objective
+    _session.set_objective(objective)
+    ranges = _session.fva(request_constraints(request, _session), _session.exchange_ids, request.fraction)
+    return {'index': index,
+            'objective': objective,
+            'fraction': request.fraction,
+            'ranges': {r_id: [float(low), float(high)] for r_id, (low, high) in ranges.items()}}
+
+
+def _fva(task):
+    base, reactions = task
+    _session.set_objective(base.objective or _session.default_objective)
+    return _session.fva(request_constraints(base, _session), reactions, base.fraction)
+
+
+class ScreenPool:
+    """
+    Process pool whose workers each load the model once and keep a warm
+    SimulationSession for every task they get.
+    compress=True solves on the compressed model (same objective values and
+    FVA ranges; pFBA/lMOMA/ROOM fluxes can differ along merged chains).
+    Its blocked reactions are then found here, once, before the workers
+    start (on `session`, the caller's uncompressed session, when given).
+    """
+
+    def __init__(self, model_path, processes=None, compress=False, session=None):
+        if compress:
+            if session is None or session.compressed:
+                model, model_key = load_model(model_path)
+            else:
+                model, model_key = session.model, session.model_key
+            blocked_reactions(model, model_key) # the workers read it from disk
+        context = multiprocessing.get_context('spawn')
+        self.pool = context.Pool(processes, initializer=_init_worker, initargs=(model_path, compress))
+
+
+    def imap(self, func, tasks):
+        # results come back as soon as each one finishes, not in task order
+        return self.pool.imap_unordered(func, tasks)
+
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+
+    def terminate(self):
+        self.pool.terminate()
+        self.pool.join()
+
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.terminate()
+
+
+
+def screen_genes(pool, genes, base=None):
+    """
+    Knock out each gene on its own on top of the base request.
+    Yields (gene, (objective, value)) as the workers finish.
+    """
+    base = base or SimulationRequest()
+    return pool.imap(_knockout, [(base, gene) for gene in genes])
+
+
+def screen_media(pool, candidates, remove='EX_glc__D_e', base=None, uptake=-1000):
+    """
+    Medium substitution screen: close the uptake of `remove` and open each
+    candidate exchange in turn (uptake -1000 is the menu's 'Open').
+    Yields (candidate, (objective, value)) as the workers finish.
+    """
+    base = base or SimulationRequest()
+    tasks = [(base, remove, candidate, uptake) for candidate in candidates if candidate != remove]
+    return pool.imap(_substitute, tasks)
+
+
+def wild_type(session, base):
+    # objective and fluxes of the base request with no extra knockouts
+    session.set_objective(base.objective or session.default_objective)
+    result = session.simulate('FBA', request_constraints(base, session))
+    if result is None: # time limit
+        return math.nan, {}
+    return result.objective_value, result.fluxes
+
+
+def candidate_pairs(session, genes, base, essential=(), fluxes=None):
+    """
+    Gene pairs worth solving: neither gene is essential on its own, and the
+    pair deletes (by GPR) at least one reaction carrying wild-type flux.
+    Any other pair leaves the wild-type solution feasible, so growth
+    cannot change.
+    """
+    if fluxes is None:
+        _, fluxes = wild_type(session, base)
+    active = {r_id for r_id, value in fluxes.items() if abs(value) > 1e-9}
+    genes = [gene for gene in genes if gene not in essential]
+
+    for pair in itertools.combinations(genes, 2):
+        if active.intersection(session.knockouts.deleted_reactions(pair)):
+            yield pair
+
+
+def _read_checkpoint(path, header):
+    # the first line names the conditions (model, method, objective, base
+    # bounds); results of other conditions are never resumed
+    done = {}
+    if not path or not os.path.exists(path) or os.path.getsize(path) == 0:
+        return done
+    with open(path) as checkpoint:
+        try:
+            first = json.loads(checkpoint.readline())
+        except ValueError:
+            first = {}
+        if first.get('header') != header:
+            raise ValueError(f'checkpoint {path} was written for other conditions; use a new file')
+        for line in checkpoint:
+            try:
+                record = json.loads(line)
+            except ValueError: # last line cut short by an interrupted run
+                continue
+            done[tuple(record['genes'])] = tuple(record['result'])
+    return done
+
+
+def screen_pairs(pool, session, genes, base=None, essential=None, checkpoint=None, threshold=0.01):
+    """
+    Double knockout screen for synthetic lethal pairs.
+    Essential genes (growth below threshold * wild-type, screened first if
+    not given) and pairs that cannot change growth are skipped.
+    Each finished pair is appended to the checkpoint file (json lines), so
+    a run started again with the same file only solves what is missing;
+    a file written for another model or base request is refused.
+    Always solved with FBA: the pruning above rests on the FBA optimum
+    staying feasible, which says nothing about pFBA/lMOMA/ROOM values.
+    Yields ((gene_a, gene_b), (objective, value)), resumed pairs included.
+    """
+    base = replace(base or SimulationRequest(), method='FBA', duals=False)
+    growth, fluxes = wild_type(session, base)
+
+    if essential is None:
+        essential = {gene for gene, result in screen_genes(pool, genes, base)
+                     if growth_value(result) < threshold * growth}
+
+    objective = base.objective or session.default_objective
+    header = cache_key(session.model_key, base.method, objective, request_constraints(base, session))
+    done = _read_checkpoint(checkpoint, header)
+    for pair, result in done.items():
+        yield pair, result
+
+    tasks = [(base, pair) for pair in candidate_pairs(session, genes, base, essential, fluxes) if pair not in done]
+    log = open(checkpoint, 'a') if checkpoint else None
+    if log and log.tell() == 0:
+        log.write(json.dumps({'header': header}) + '\n')
+    try:
+        for pair, result in pool.imap(_pair, tasks):
+            if log:
+                log.write(json.dumps({'genes': list(pair), 'result': list(result)}) + '\n')
+                log.flush()
+            yield pair, result
+    finally:
+        if log:
+            log.close()
+
+
+def synthetic_lethals(results, growth, threshold=0.01):
+    return sorted(pair for pair, result in results if growth_value(result) < threshold * growth)
+
+
+def split(items, parts):
+    size = max(1, -(-len(items) // parts)) # ceiling division
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def fva(pool, base, reactions, chunks=8):
+    """
+    Flux variability analysis of `reactions` under the base request, at
+    base.fraction of the optimum. The 2 x N LPs are split in chunks over
+    the pool workers; yields one {reaction: [min, max]} dict per chunk.
+    """
+    return pool.imap(_fva, [(base, chunk) for chunk in split(list(reactions), chunks)])
+
+
+def run_batch(pool, requests, fluxes=False):
+    """
+    Any number of requests, (index, SimulationRequest) pairs, over the pool.
+    Yields one JSON-ready dict per request as the workers finish; non-zero
+    fluxes are included when asked.
+    """
+    return pool.imap(_run, ((index, request, fluxes) for index, request in requests))
+
+
+def sweep_line(session, base, r_id, uptakes):
+    """
+    Growth of the base request with the uptake of r_id set to each value
+    (lb = -uptake), in order on one warm LP: between solves only that bound
+    changes on the model.
+    """
+    values = []
+    for uptake in uptakes:
+        bounds = dict(base.bounds)
+        _, ub = bounds.get(r_id, session.default_bounds(r_id))
+        bounds[r_id] = (-uptake, ub)
+        result = run_simul(replace(base, bounds=bounds, duals=False), session)
+        values.append(growth_value(result.summary()))
+    return values
+
+
+def sweep(pool, base, x_id, x_uptakes, y_id=None, y_uptakes=(0,)):
+    """
+    Phenotype phase plane: growth over a grid of uptake rates of x_id and
+    (optionally) y_id. Each row (one y value, every x value) is a task, so
+    a 2D grid spreads over the pool while each row stays on one warm LP.
+    Yields (row index, [growth per x]); see sweep_grid.
+    """
+    x_uptakes = list(x_uptakes)
+    y_uptakes = list(y_uptakes) if y_id else [0]
+    return pool.imap(_sweep_row, [(base, x_id, x_uptakes, y_id, y, row) for row, y in enumerate(y_uptakes)])
+
+
+def sweep_grid(rows, columns):
+    # rows of a finished sweep (any order) -> array indexed [y, x]; nan where unsolved
+    grid = np.full((max(len(rows), 1), columns), np.nan)
+    for row, values in rows:
+        grid[row] = values
+    return grid
+
+
+def rank(results, reverse=True):
+    """
+    Growth table from a finished screen, best growth first by default.
+    """
+    solved = [item for item in results if not math.isnan(growth_value(item[1]))]
+    timed_out = [item for item in results if math.isnan(growth_value(item[1]))]
+    return sorted(solved, key=lambda item: growth_value(item[1]), reverse=reverse) + timed_out
+
+
+def growth_value(result):
+    # infeasible runs count as no growth; a run that hit the time limit is
+    # unknown (nan), so it is never taken as essential or lethal
+    value = result[1]
+    if isinstance(value, (int, float)):
+        return value
+    return math.nan if value == 'Status: TIME_LIMIT' else 0.0
+
+
+
+if __name__ == '__main__':
+    # python code/screening.py genes [--model NAME]
+    # python code/screening.py pairs --checkpoint FILE.jsonl [--model NAME] [--processes N]
+    # (from the repository root; a pairs run stopped half way resumes from its checkpoint)
+    import argparse
+    from model_registry import ModelRegistry, DEFAULT_MODEL
+    from essential_genes import read_essential
+    parser = argparse.ArgumentParser(description='Gene knockout screens without the game.')
+    parser.add_argument('screen', choices=['genes', 'pairs'])
+    parser.add_argument('--model', default=DEFAULT_MODEL)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--checkpoint', help='json lines file of finished pairs (pairs only)')
+    parser.add_argument('--threshold', type=float, default=0.01, help='fraction of wild-type growth taken as lethal')
+    args = parser.parse_args()
+
+    model_path = ModelRegistry().path(args.model)
+    session = SimulationSession(*load_model(model_path))
+    genes = list(session.genes.index)
+    with ScreenPool(model_path, args.processes, compress=True, session=session) as pool:
+        if args.screen == 'genes':
+            for gene, result in screen_genes(pool, genes):
+                print(gene, result[1])
+        else:
+            if not args.checkpoint:
+                parser.error('pairs needs --checkpoint')
+            growth, _ = wild_type(session, SimulationRequest())
+            essential = read_essential(session.model_key, args.threshold) # None: screened first
+            results = list(screen_pairs(pool, session, genes, essential=essential,
+                                        checkpoint=args.checkpoint, threshold=args.threshold))
+            for pair in synthetic_lethals(results, growth, args.threshold):
+                print(*pair)
@@ -0,0 +1,133 @@
+import json
+import time
+import itertools
+import pickle
+import multiprocessing
+from collections import OrderedDict
+from simulation import run_simul
+from model_registry import ModelRegistry, DEFAULT_MODEL
+from utils import *
+
+
+
+def request_key(model_name, request):
+    # identical requests (knockouts in any order) give the same key
+    data = request.to_dict()
+    data['knockouts'] = sorted(data['knockouts'])
+    return json.dumps([model_name, data], sort_keys=True)
+
+
+def _serve(model_name, conn):
+    # runs in the worker process: warm sessions for the whole game
+    registry = ModelRegistry()
+    registry.get(model_name)
+    while True:
+        data = conn.recv_bytes()
+        start = time.perf_counter()
+        message = pickle.loads(data)
+        if message is None:
+            break
+        ticket, name, request = message
+        decoded = time.perf_counter()
+        try:
+            session = registry.get(name) # only slow when the player switched models
+            timings = {'decode': decoded - start, 'load': time.perf_counter() - decoded}
+            conn.send((ticket, 'done', run_simul(request, session, timings)))
+        except Exception as error:
+            conn.send((ticket, 'error', str(error)))
+
+
+class SimulationWorker:
+    """
+    Runs simulations in a separate process so the game keeps drawing while
+    the solver works. Cancelling kills the process (the only way to stop a
+    solve half way); a new one is started on the next submit.
+    Every submit gets a ticket and every answer comes back tagged with it.
+    Submitting a request identical to one still in flight returns that
+    request's ticket, so both callers share the one solve.
+    """
+
+    def __init__(self, model_name=DEFAULT_MODEL):
+        self.model_name = model_name # loaded as soon as the process starts
+        self.context = multiprocessing.get_context('spawn') # never fork a running pygame
+        self.process = None
+        self.conn = None
+        self.tickets = itertools.count()
+        self.pending = {} # request key -> ticket in flight
+        self.started = {} # ticket in flight -> time it was submitted
+        self.answers = OrderedDict() # ticket -> answer, the most recent ones
+
+
+    def start(self):
+        self.conn, child_conn = self.context.Pipe()
+        self.process = self.context.Process(target=_serve, args=(self.model_name, child_conn), daemon=True)
+        self.process.start()
+
+
+    @property
+    def running(self):
+        return bool(self.started)
+
+
+    def elapsed(self, ticket):
+        return time.perf_counter() - self.started[ticket] if ticket in self.started else 0.0
+
+
+    def submit(self, request, model_name=DEFAULT_MODEL):
+        """
+        Ticket to poll() for the answer; the same ticket as the identical
+        request already in flight, if any.
+        """
+        key = request_key(model_name, request)
+        if key in self.pending:
+            return self.pending[key]
+
+        if self.process is None or not self.process.is_alive():
+            self.start()
+        ticket = next(self.tickets)
+        self.conn.send((ticket, model_name, request))
+        self.pending[key] = ticket
+        self.started[ticket] = time.perf_counter()
+        return ticket
+
+
+    def _answer(self, ticket, answer):
+        self.answers[ticket] = answer
+        while len(self.answers) > 16:
+            self.answers.popitem(last=False)
+        self.started.pop(ticket, None)
+        for key in [key for key, pending in self.pending.items() if pending == ticket]:
+            del self.pending[key]
+
+
+    def poll(self, ticket):
+        """
+        Returns None while that ticket is running, otherwise ('done', result)
+        or ('error', message), to every caller that holds the ticket.
+        """
+        if ticket in self.started:
+            while self.conn.poll():
+                answer_ticket, status, payload = self.conn.recv()
+                self._answer(answer_ticket, (status, payload))
+            if ticket in self.started and not self.process.is_alive():
+                for lost in list(self.started):
+                    self._answer(lost, ('error', 'simulation worker stopped'))
+        return self.answers.get(ticket)
+
+
+    def cancel(self):
+        # stops every request in flight
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join()
+        self.process = None
+        self.conn = None
+        self.pending.clear()
+        self.started.clear()
+
+
+    def close(self):
+        if self.process is not None and self.process.is_alive():
+            self.conn.send(None)
+            self.process.join(1)
+        self.cancel()
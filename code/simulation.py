@@ -1,78 +1,476 @@
+import os
+import json
+import time
+import logging
 import mewpy
+import numpy as np
+from logging.handlers import RotatingFileHandler
+from enum import Enum
+from collections import OrderedDict
+from types import SimpleNamespace
+from dataclasses import dataclass, field, asdict
 from cobra.io import read_sbml_model
+from cobra.flux_analysis import pfba, moma, room
+from cobra.exceptions import OptimizationError, Infeasible
 from mewpy.simulation import get_simulator
 from save_load import *
-from options_values import *
+from result_cache import ResultCache, cache_key
+from gene_index import KnockoutIndex
+from compression import CompressedModel
 
-def run_simul():
+AUDIT_LOG = False # write every request to player_history/simulation_file.txt
+TIMING_LOG = True # phase timings of every run to player_history/timings.log (rolling)
 
-    data_simul = load_file(get_resource_path('code/player_history/simulation_file'))
+# per method solver limits: time in seconds, relative MIP gap (ROOM is a MILP);
+# None means no limit
+SOLVER_LIMITS = {
+    'FBA': {'time': 30, 'gap': None},
+    'pFBA': {'time': 30, 'gap': None},
+    'lMOMA': {'time': 60, 'gap': None},
+    'ROOM': {'time': 60, 'gap': 0.01},
+}
 
-    method, objective, genes, reactions = data_simul
 
-    method = method['method'][0][0]
-    objective_name = objective['objective'][0][0]
-    # objective_fraction = objective['obj_fraction']
+@dataclass
+class SimulationRequest:
+    """
+    One simulation as chosen in the Simulation Menu.
+    bounds maps exchange reaction ids to (lb, ub); knockouts are gene ids.
+    """
+    method: str = 'FBA'
+    objective: str = ''
+    knockouts: tuple = ()
+    bounds: dict = field(default_factory=dict)
+    fraction: float = 0.9 # fraction of the optimum kept by FVA
+    duals: bool = False # FBA only: keep shadow prices and reduced costs of the solve
 
-    envconditions = {}
+    @classmethod
+    def from_menu(cls, data_simul, data_objective, data_genes, data_reac, session):
+        # toggles read by id in (lb, ub) pairs, so widget order does not matter
+        toggles = np.array([data_reac[key] for key in session.exchange_toggles], dtype=bool).reshape(-1, 2)
+        lb = np.where(toggles[:, 0], -1000.0, 0.0) # lower bound open means uptake is allowed
+        ub = np.where(toggles[:, 1], 1000.0, 0.0)
 
-    # initial simulation:
-    simul = get_simulator(model) #, envcond=envconditions)
+        return cls(method=data_simul['method'][0][0],
+                   objective=data_objective['objective'][0][0],
+                   knockouts=tuple(gene for gene, active in data_genes.items() if not active),
+                   bounds=dict(zip(session.exchange_ids, zip(lb.tolist(), ub.tolist()))),
+                   fraction=data_objective.get('obj_fraction', 90) / 100,
+                   duals=data_simul['method'][0][0] == 'FBA')
 
+    def to_dict(self):
+        return asdict(self)
 
-    reactions_original = simul.find_reactions('EX') # dataframe
-    
-    
-    count = 0 # to access reactions
-    count_2 = 0 # to access flow in and out inside each reaction (pair by pair)
-    for i,(k,x) in enumerate(reactions.items()):
-        if count_2 % 2 == 0: # if it's even, it means the toggle for the flow in
-            envconditions[REACTIONS.index[count]] = (reactions_original.lb[count], reactions_original.ub[count])
-            if not x:
-                envconditions[REACTIONS.index[count]] = (0, envconditions[REACTIONS.index[count]][1])
-            else:
-                envconditions[REACTIONS.index[count]] = (-1000, envconditions[REACTIONS.index[count]][1])
-            count_2 += 1
+    @classmethod
+    def from_dict(cls, data):
+        return cls(method=data['method'],
+                   objective=data['objective'],
+                   knockouts=tuple(data['knockouts']),
+                   bounds={r_id: tuple(b) for r_id, b in data['bounds'].items()},
+                   fraction=data.get('fraction', 0.9),
+                   duals=data.get('duals', False))
+
+
+class Status(Enum):
+    OPTIMAL = 'OPTIMAL'
+    INFEASIBLE = 'INFEASIBLE'
+    UNBOUNDED = 'UNBOUNDED'
+    TIME_LIMIT = 'TIME_LIMIT'
+    UNKNOWN = 'UNKNOWN'
+
+
+@dataclass
+class SimulationResult:
+    """
+    Outcome of one run. fluxes is aligned with `reactions`, the reaction
+    index of the session (shared, not copied). Formatting for the menus is
+    left to summary(). shadow_prices (per metabolite) and reduced_costs (per
+    reaction) are only kept for requests with duals, non-zero values only.
+    timings are not cached: a result read from the cache has its own.
+    """
+    objective: str
+    status: Status
+    objective_value: float
+    fluxes: np.ndarray
+    reactions: list
+    shadow_prices: dict = None
+    reduced_costs: dict = None
+    timings: dict = None # seconds per phase of the run that produced it, see PhaseTimer
+
+    @classmethod
+    def from_mewpy(cls, objective, result, reactions):
+        name = getattr(result.status, 'name', str(result.status)).upper()
+        status = Status.__members__.get(name, Status.UNKNOWN)
+        if status == Status.OPTIMAL and result.fluxes:
+            fluxes = np.array([result.fluxes[r_id] for r_id in reactions], dtype=float)
+        else:
+            fluxes = np.full(len(reactions), np.nan)
+        value = result.objective_value if result.objective_value is not None else np.nan
+        return cls(objective, status, float(value), fluxes, reactions)
+
+    @classmethod
+    def from_cobra(cls, objective, solution, reactions):
+        status = Status.__members__.get(solution.status.upper(), Status.UNKNOWN)
+        if status == Status.OPTIMAL:
+            fluxes = solution.fluxes[reactions].to_numpy(dtype=float)
+            shadow_prices = {m_id: float(v) for m_id, v in solution.shadow_prices.items() if abs(v) > 1e-9}
+            reduced_costs = {r_id: float(v) for r_id, v in solution.reduced_costs.items() if abs(v) > 1e-9}
         else:
-            if not x: # if it's uneven, it means the toggle for the flow out
-                envconditions[REACTIONS.index[count]] = (envconditions[REACTIONS.index[count]][0], 0)
+            fluxes = np.full(len(reactions), np.nan)
+            shadow_prices, reduced_costs = {}, {}
+        value = solution.objective_value if solution.objective_value is not None else np.nan
+        return cls(objective, status, float(value), fluxes, reactions, shadow_prices, reduced_costs)
+
+    @classmethod
+    def time_limit(cls, objective, reactions):
+        # no optimal solution in time; what the solver holds then is not the
+        # value of `objective` (ROOM minimises a distance), so none is kept
+        return cls(objective, Status.TIME_LIMIT, np.nan, np.full(len(reactions), np.nan), reactions)
+
+    def flux(self, r_id):
+        return self.fluxes[self.reactions.index(r_id)]
+
+    def value(self):
+        # what the menus and the missions show
+        if self.status != Status.OPTIMAL:
+            return f'Status: {self.status.value}'
+        return round(self.objective_value, 3)
+
+    def summary(self):
+        # (objective, value) pair kept in player.results and the save file
+        return self.objective, self.value()
+
+    def to_dict(self):
+        return {'objective': self.objective,
+                'status': self.status.value,
+                'objective_value': self.objective_value,
+                'fluxes': self.fluxes.tolist(),
+                'shadow_prices': self.shadow_prices,
+                'reduced_costs': self.reduced_costs}
+
+    @classmethod
+    def from_dict(cls, data, reactions):
+        return cls(data['objective'], Status(data['status']), data['objective_value'],
+                   np.array(data['fluxes'], dtype=float), reactions,
+                   data.get('shadow_prices'), data.get('reduced_costs'))
+
+
+class SimulationSession:
+    """
+    Keeps one simulator alive for a loaded model.
+    Bounds are changed in place on the model, so between runs the solver only
+    sees the reactions whose bounds actually changed.
+    With compress=True the LPs are solved on a CompressedModel; requests,
+    objectives and fluxes still use the reaction ids of the full model.
+    """
+
+    def __init__(self, model, model_key=None, compress=False):
+        model_key = model_key or model.id
+        self.compressed = CompressedModel(model, model_key) if compress else None
+        self.model = self.compressed.model if compress else model # the one the solver sees
+        self.model_key = model_key + ('-compressed' if compress else '') # identifies the model in cache keys
+        self.simul = get_simulator(self.model)
+        tables = get_simulator(model) if compress else self.simul # full model listings for the menus
+        self.default_objective = list(tables.objective.keys())[0]
+        self.objective = self.default_objective
+
+        self.reactions = list(tables.reactions) # index of every flux vector
+        self.exchanges = tables.find_reactions('EX') # dataframe
+        self.exchange_ids = list(self.exchanges.index)
+        self.exchange_lb = self.exchanges.lb.to_numpy(dtype=float) # model defaults, aligned to exchange_ids
+        self.exchange_ub = self.exchanges.ub.to_numpy(dtype=float)
+        self.exchange_toggles = [f'{r_id}_{side}' for r_id in self.exchange_ids for side in ('lb', 'ub')] # menu widget ids
+        self.genes = tables.find_genes() # dataframe
+        self.knockouts = KnockoutIndex(model) # GPR rules compiled once
+        self.essential = None # frozenset of essential gene ids, when the registry computed it
+
+        self._defaults = {} # original bounds of every reaction touched so far
+        self._applied = set() # reactions currently away from their defaults
+        self._references = OrderedDict() # wild-type fluxes per (objective, medium)
+
+        self.cache = ResultCache(folder=f'code/player_history/cache/{self.model_key[:16]}')
+        self.limits = {method: dict(limits) for method, limits in SOLVER_LIMITS.items()}
+
+
+    def set_objective(self, objective_name):
+        if objective_name != self.objective:
+            if self.compressed:
+                self.simul.objective = self.compressed.objective(objective_name)
+            else:
+                self.simul.objective = objective_name
+            self.objective = objective_name
+
+
+    def set_bounds(self, constraints):
+        if self.compressed:
+            constraints = self.compressed.translate(constraints)
+
+        # reactions changed on the last run but not on this one go back to the defaults
+        target = {r_id: self._defaults[r_id] for r_id in self._applied}
+        target.update(constraints)
+
+        for r_id, bounds in target.items():
+            reaction = self.model.reactions.get_by_id(r_id)
+            bounds = tuple(bounds)
+            # remembered on first touch, even when the request asks for the default itself
+            self._defaults.setdefault(r_id, reaction.bounds)
+            if reaction.bounds != bounds:
+                reaction.bounds = bounds
+
+        self._applied = {r_id for r_id in constraints if tuple(constraints[r_id]) != self._defaults[r_id]}
+
+
+    def default_bounds(self, r_id):
+        # bounds the model was loaded with, even if a run changed them since
+        if self.compressed:
+            return self.compressed.bounds[r_id]
+        if r_id in self._defaults:
+            return self._defaults[r_id]
+        return self.model.reactions.get_by_id(r_id).bounds
+
+
+    def reference(self, medium=None):
+        """
+        Wild-type pFBA solution (no knockouts) in the given medium, used by
+        lMOMA and ROOM. Computed once per objective and medium, so a
+        knockout sweep only solves the distance problem. None when the
+        medium cannot sustain the wild type.
+        """
+        medium = medium or {}
+        key = cache_key(self.model_key, 'pFBA', self.objective, medium)
+        if key not in self._references:
+            self.set_bounds(medium)
+            with self.model as model:
+                model.objective = {model.reactions.get_by_id(r_id): coefficient
+                                   for r_id, coefficient in self._objective_coefficients().items()}
+                try:
+                    self._references[key] = pfba(model)
+                except Infeasible: # e.g. carbon source closed: every run in it is infeasible
+                    self._references[key] = None
+            while len(self._references) > 32:
+                self._references.popitem(last=False)
+        self._references.move_to_end(key)
+        return self._references[key]
+
+
+    def _objective_coefficients(self):
+        # objective as {reaction id of the solved model: coefficient}
+        if self.compressed:
+            return self.compressed.objective(self.objective)
+        return {self.objective: 1.0}
+
+
+    def _distance_result(self, solution):
+        # cobra lMOMA/ROOM solution shaped like a mewpy result; the objective
+        # value is the flux of the objective, not the distance that was minimised
+        fluxes = solution.fluxes.to_dict() if solution.status == 'optimal' else None
+        value = None
+        if fluxes:
+            value = sum(coefficient * fluxes[r_id] for r_id, coefficient in self._objective_coefficients().items())
+        return SimpleNamespace(status=solution.status, fluxes=fluxes, objective_value=value)
+
+
+    def set_limits(self, method):
+        limits = self.limits.get(method, {})
+        solver = self.model.solver
+        solver.configuration.timeout = limits.get('time')
+
+        gap = limits.get('gap')
+        if gap is None:
+            return
+        interface = solver.interface.__name__
+        try:
+            if 'glpk' in interface:
+                solver.configuration._iocp.mip_gap = gap
+            elif 'cplex' in interface:
+                solver.problem.parameters.mip.tolerances.mipgap.set(gap)
+            elif 'gurobi' in interface:
+                solver.problem.Params.MIPGap = gap
+        except AttributeError: # solver without a MIP gap setting
+            pass
+
+
+    def simulate(self, method, constraints, medium=None):
+        """
+        The mewpy result (a look-alike for lMOMA/ROOM), or None when the
+        solver hit its time limit.
+        """
+        self.set_limits(method)
+        try:
+            if method in ('lMOMA', 'ROOM'):
+                # mewpy's simulate ignores reference= and solves its own pFBA
+                # every time, so the distance problem goes to cobra directly
+                reference = self.reference(medium)
+                self.set_bounds(constraints) # only the knockouts differ from the reference run
+                if reference is None:
+                    # no wild type to stay close to; the knockouts can only remove flux
+                    return SimpleNamespace(status='infeasible', fluxes=None, objective_value=None)
+                with self.model as model:
+                    if method == 'lMOMA':
+                        solution = moma(model, solution=reference, linear=True)
+                    else:
+                        solution = room(model, solution=reference)
+                result = self._distance_result(solution)
             else:
-                envconditions[REACTIONS.index[count]] = (envconditions[REACTIONS.index[count]][0], 1000)
-            count_2 += 1
-            count += 1
-        
+                self.set_bounds(constraints)
+                result = self.simul.simulate(method=method)
+        except (KeyError, OptimizationError) as error:
+            # mewpy raises KeyError('time_limit') (no solution to read),
+            # cobra an OptimizationError naming the status
+            if 'time_limit' in str(error):
+                return None
+            raise
+
+        if self.compressed and result.fluxes:
+            result.fluxes = self.compressed.expand(result.fluxes)
+        return result
+
+
+    def solve_duals(self, constraints):
+        """
+        FBA straight on the cobra model, which keeps the duals of the solve
+        (cobra Solution with shadow_prices and reduced_costs). Full models only.
+        """
+        if self.compressed:
+            raise ValueError('duals need an uncompressed session')
+        self.set_limits('FBA')
+        self.set_bounds(constraints)
+        with self.model as model:
+            model.objective = self.objective
+            return model.optimize()
+
+
+    def fva(self, constraints, reactions=None, fraction=0.9):
+        """
+        Min/max flux of each reaction (all when None) while keeping
+        `fraction` of the optimal objective.
+        """
+        self.set_limits('FBA') # applies to each of the FVA LPs
+        self.set_bounds(constraints)
+        if not self.compressed:
+            return self.simul.FVA(reactions=reactions, obj_frac=fraction, format='dict')
+
+        # one LP pair per representative, shared by its whole chain
+        reactions = reactions or self.reactions
+        owner = self.compressed.owner
+        representatives = sorted({owner[r_id][0] for r_id in reactions if r_id in owner})
+        ranges = self.simul.FVA(reactions=representatives, obj_frac=fraction, format='dict') if representatives else {}
+        ranges = self.compressed.expand_ranges(ranges)
+        return {r_id: ranges[r_id] for r_id in reactions}
+
+
+    def reset(self):
+        """
+        Restore the model default bounds and objective.
+        """
+        self.set_bounds({})
+        self.set_objective(self.default_objective)
+
+
+
+class PhaseTimer:
+    """
+    Seconds spent in each phase of a run: lap(phase) adds the time since
+    the previous lap. Phases timed by the caller (decode, load) can be
+    passed in.
+    """
+
+    def __init__(self, timings=None):
+        self.timings = dict(timings or {})
+        self._last = time.perf_counter()
+
+    def lap(self, phase):
+        now = time.perf_counter()
+        self.timings[phase] = self.timings.get(phase, 0.0) + now - self._last
+        self._last = now
 
-    # print(envconditions)
 
-    # REACTIONS WITH RANGE - deactivated
-    # count = 0
-    # for i,(k, x) in enumerate(reactions.items()):
-    #     if k == REACTIONS.index[count]:
-    #         if reactions_original.lb[count] != x[0] or reactions_original.ub[count] != x[1]:
-    #             envconditions[k] = (x[0], x[1])
-    #     else:
-    #         count += 1
-    #         if not x:
-    #             envconditions[REACTIONS.index[count-1]] = (0, 0)
+_timing_logger = None
 
+def timing_logger():
+    # one JSON line per run; the file rolls over at 1 MB, keeping 3 old ones
+    global _timing_logger
+    if _timing_logger is None:
+        _timing_logger = logging.getLogger('labhero.timings')
+        _timing_logger.setLevel(logging.INFO)
+        _timing_logger.propagate = False
+        path = get_resource_path('code/player_history/timings.log')
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            handler = RotatingFileHandler(path, maxBytes=1_000_000, backupCount=3)
+        except OSError:
+            handler = logging.NullHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        _timing_logger.addHandler(handler)
+    return _timing_logger
 
-    for i,(k,x) in enumerate(genes.items()):
-        if not x:
-            # print(k)
-            # print(simul.find_genes().reactions[i])
-            list_react = simul.find_genes().reactions[i]
-            for react in list_react:
-                envconditions[react] = (0,0)
 
-    # gene knockout:
-    # model.genes.b1524.knock_out()
+def log_timings(request, session, result):
+    timing_logger().info(json.dumps({'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                                     'model': session.model_key[:16],
+                                     'method': request.method,
+                                     'objective': result.objective,
+                                     'knockouts': len(request.knockouts),
+                                     'status': result.status.value,
+                                     'cached': 'solve' not in result.timings,
+                                     'timings': {phase: round(seconds, 6) for phase, seconds in result.timings.items()}}))
 
 
-    # print(envconditions)
+
+def request_constraints(request, session, timer=None):
+    """
+    Exchange bounds of the request plus the reactions its knockouts delete.
+    """
+    envconditions = dict(request.bounds)
+    if timer:
+        timer.lap('bounds')
+
+    # only reactions left without a working enzyme (GPR rules) are deleted
+    for react in session.knockouts.deleted_reactions(request.knockouts):
+        envconditions[react] = (0,0)
+    if timer:
+        timer.lap('genes')
+
+    return envconditions
+
+
+
+def run_simul(request, session=None, timings=None):
+    """
+    Solve one request on a warm session (the game's when None). The result
+    carries the time spent per phase: load, decode, bounds, genes, cache,
+    solve, extract (plus any phase given in timings by the caller).
+    """
+    timer = PhaseTimer(timings)
+    if session is None:
+        from options_values import preloader
+        session = preloader.get()
+        timer.lap('load')
+
+    results = _run_simul(request, session, timer)
+    results.timings = timer.timings
+    if TIMING_LOG:
+        log_timings(request, session, results)
+    return results
+
+
+def _run_simul(request, session, timer):
+
+    if request.method not in SOLVER_LIMITS:
+        # FVA gives a range per reaction, not one result: see SimulationSession.fva
+        raise ValueError(f'run_simul cannot solve method {request.method!r}')
+
+    if AUDIT_LOG:
+        save_simulation_file(request.to_dict())
+
+    objective_name = request.objective or session.default_objective
 
     # choose objective (by default Biomass):
     # objective = ''
-    simul.objective = objective_name
+    session.set_objective(objective_name)
+    timer.lap('decode')
+
+    envconditions = request_constraints(request, session, timer)
 
     # add constraints here (modifications on the game)
     constraints = {}
@@ -83,34 +481,62 @@ def run_simul():
     #               }
 
     # chooose simulation method (by default FBA):
-    sim_method = method
+    sim_method = request.method
 
-    # run a simulation accounting with the new constraint
-    result = simul.simulate(method=sim_method, constraints=constraints)
+    # identical conditions were already solved (this session or a previous one)
+    key = cache_key(session.model_key, sim_method, objective_name, constraints)
+    cached = session.cache.get(key)
+    duals = request.duals and sim_method == 'FBA' and not session.compressed
+    timer.lap('cache')
+    if cached is not None and (not duals or cached.get('reduced_costs') is not None):
+        results = SimulationResult.from_dict(cached, session.reactions)
+        timer.lap('extract')
+        return results
 
-    # print(constraints)
-    results_str = str(result)
-    # print(results_str)
+    session.set_bounds(constraints) # the solve below finds them already in place
+    timer.lap('bounds')
 
-    
-    try:
-        if str(results_str.splitlines()[1]) == 'Status: INFEASIBLE':
-            results = 'Status: INFEASIBLE'
-        else:
-            results = round(float(str(results_str.splitlines()[0])[11:]), 3)
-    except:
-        results = results_str
+    if duals:
+        # same single LP, only solved where its duals can be read
+        solution = session.solve_duals(constraints)
+        timer.lap('solve')
+        results = SimulationResult.from_cobra(objective_name, solution, session.reactions)
+        if results.status in (Status.OPTIMAL, Status.INFEASIBLE):
+            session.cache.put(key, results.to_dict())
+        timer.lap('extract')
+        return results
+
+    # run a simulation accounting with the new constraint
+    result = session.simulate(sim_method, constraints, request.bounds)
+    timer.lap('solve')
+    if result is None:
+        # give up on this run instead of hanging the game
+        return SimulationResult.time_limit(objective_name, session.reactions)
+    results = SimulationResult.from_mewpy(objective_name, result, session.reactions)
+
+    if results.status in (Status.OPTIMAL, Status.INFEASIBLE):
+        session.cache.put(key, results.to_dict())
+    timer.lap('extract')
 
-    # print(result_str)
+    return results
 
-    # save_results(result)
 
-    return objective_name, results
 
-    # print(simul.objective)
+def limiting_nutrients(result, top=5, exchanges=None):
+    """
+    Exchanges whose extra uptake would raise the objective the most, read
+    from the reduced costs of a duals run: [(r_id, gain per unit uptake)].
+    More uptake means a more negative flux, so the gain is -reduced cost.
+    """
+    gains = [(r_id, -cost) for r_id, cost in (result.reduced_costs or {}).items()
+             if -cost > 1e-9 and (r_id in exchanges if exchanges is not None else r_id.startswith('EX_'))]
+    gains.sort(key=lambda gain: gain[1], reverse=True)
+    return [(r_id, round(gain, 4)) for r_id, gain in gains[:top]]
 
 
 
 if __name__ == '__main__':
-     print(run_simul())
+     # replays the last request saved with AUDIT_LOG on
+     request = SimulationRequest.from_dict(load_file(get_resource_path('code/player_history/simulation_file')))
+     print(run_simul(request).summary())
     
\ No newline at end of file
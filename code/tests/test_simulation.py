@@ -0,0 +1,62 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+simulation = pytest.importorskip('simulation') # needs mewpy and cobra
+
+
+class FakeReaction:
+    def __init__(self, bounds):
+        self.bounds = bounds
+
+
+class FakeReactions(dict):
+    def get_by_id(self, r_id):
+        return self[r_id]
+
+
+def fake_session():
+    session = simulation.SimulationSession.__new__(simulation.SimulationSession)
+    session.model = type('Model', (), {})()
+    session.model.reactions = FakeReactions(EX_ac_e=FakeReaction((0, 1000)),
+                                            EX_glc__D_e=FakeReaction((-10, 1000)),
+                                            PGK=FakeReaction((-1000, 1000)))
+    session.compressed = None
+    session._defaults = {}
+    session._applied = set()
+    return session
+
+
+def test_set_bounds_twice_with_defaults_requested():
+    session = fake_session()
+    session.set_bounds({'EX_ac_e': (0, 1000), 'EX_glc__D_e': (-1000, 1000), 'PGK': (0, 0)})
+    session.set_bounds({'EX_ac_e': (0, 1000), 'EX_glc__D_e': (-10, 1000)})
+
+    reactions = session.model.reactions
+    assert reactions['EX_ac_e'].bounds == (0, 1000)
+    assert reactions['EX_glc__D_e'].bounds == (-10, 1000)
+    assert reactions['PGK'].bounds == (-1000, 1000) # knockout of the first run undone
+    assert session._applied == set()
+
+
+@pytest.fixture
+def core_session(tmp_path, monkeypatch):
+    from model_cache import load_model
+    from utils import get_resource_path
+    monkeypatch.setattr(simulation, 'TIMING_LOG', False)
+    model_path = get_resource_path('data/models/e_coli_core.xml.gz')
+    if not os.path.exists(model_path):
+        model_path = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'models', 'e_coli_core.xml.gz')
+    session = simulation.SimulationSession(*load_model(model_path, folder=str(tmp_path)))
+    session.cache.disk = False
+    return session
+
+
+@pytest.mark.parametrize('method', ['lMOMA', 'ROOM'])
+def test_distance_methods_in_closed_medium(core_session, method):
+    # no glucose: the wild-type reference itself cannot be solved
+    request = simulation.SimulationRequest(method=method, bounds={'EX_glc__D_e': (0, 1000)})
+    result = simulation.run_simul(request, core_session)
+    assert result.status == simulation.Status.INFEASIBLE
+    assert result.value() == 'Status: INFEASIBLE'
@@ -1,8 +1,17 @@
 import sys
 import os
+import hashlib
 
 def get_resource_path(relative_path):
     """ Get the absolute path to the resource"""
     if hasattr(sys, '_MEIPASS'):
         return os.path.join(sys._MEIPASS, relative_path)
     return os.path.join(os.path.abspath("."), relative_path)
+
+def file_hash(path):
+    """ sha256 of a file, used to tell apart versions of the same model"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
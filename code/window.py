@@ -1,11 +1,17 @@
 import pygame
 import pygame_menu
+import numpy as np
 from settings import *
 from save_load import *
 from timers import Timer
 from options_values import *
 from simulation import *
-from functions import animation_text_save
+from sim_worker import SimulationWorker
+from flux_history import FluxHistory
+from preloader import ModelPreloader
+from screening import ScreenPool, screen_genes, screen_media, fva, split, rank, sweep, sweep_grid
+from functions import animation_text_save, wait_simulation, wait_screen, wait_loading, heatmap_surface
+from dataclasses import replace
 
 
 class Window:
@@ -19,14 +25,37 @@ class Window:
         # font2_path = get_resource_path('font/NotoColorEmoji-Regular.ttf')
         # self.font = pygame.font.Font(font_path,30)
         self.results = ''
+        self.worker = SimulationWorker() # solves off the game loop
+        self.worker.start() # its process loads the model while the player walks to the desk
+        self.model_name = preloader.name
+        self.loader = preloader
+        self.histories = {} # flux history per model
 
         # self.index = 0
         self.timer = Timer(200)
 
 
 
+    def load_session(self):
+        # the default model has been loading since the game started; wait only if it is not ready yet
+        if self.loader.name != self.model_name:
+            self.loader = ModelPreloader(registry, self.model_name)
+        if not self.loader.ready:
+            wait_loading(self.loader)
+        session = self.loader.get()
+        if session.model_key not in self.histories:
+            self.histories[session.model_key] = FluxHistory(session.model_key, session.reactions)
+        self.history = self.histories[session.model_key]
+        return session
+
+
     def setup(self):
 
+        session = self.load_session()
+        REACTIONS = session.exchanges # dataframe
+        GENES = list(session.genes.index)
+        model_path = registry.path(self.model_name)
+
         ecoli_rip = get_resource_path('graphics/environment/ecoli_rip.jpg')
         
         menu = pygame_menu.Menu(
@@ -69,16 +98,10 @@ class Window:
         # Reactions (Range slider) // pode-se alterar as bounds para text inputs de forma a alterar para 0,0 (com range slider não é possível)  
         for i in range(len(REACTIONS.name)):
             menu_reactions.add.label(REACTIONS.name[i])
-            if REACTIONS.lb[i] != 0:
-                default_lb_bool = True
-            else:
-                default_lb_bool = False
-            if REACTIONS.ub[i] != 0:
-                default_ub_bool = True
-            else:
-                default_ub_bool = False
-            menu_reactions.add.toggle_switch('Lower Bound',default_lb_bool, onchange=None, state_text=('Closed', 'Open'), state_text_font_size=20, font_size = 24, state_color=('grey','gold'), state_text_font_color=('black', 'black')) #, kwargs=txt, toggleswitch_id=txt)
-            menu_reactions.add.toggle_switch('Upper Bound',default_ub_bool, onchange=None, state_text=('Closed', 'Open'), state_text_font_size=20, font_size = 24, state_color=('grey','gold'), state_text_font_color=('black', 'black')) #, kwargs=txt, toggleswitch_id=txt)
+            default_lb_bool = bool(session.exchange_lb[i] != 0)
+            default_ub_bool = bool(session.exchange_ub[i] != 0)
+            menu_reactions.add.toggle_switch('Lower Bound',default_lb_bool, onchange=None, state_text=('Closed', 'Open'), state_text_font_size=20, font_size = 24, state_color=('grey','gold'), state_text_font_color=('black', 'black'), toggleswitch_id=session.exchange_toggles[2*i])
+            menu_reactions.add.toggle_switch('Upper Bound',default_ub_bool, onchange=None, state_text=('Closed', 'Open'), state_text_font_size=20, font_size = 24, state_color=('grey','gold'), state_text_font_color=('black', 'black'), toggleswitch_id=session.exchange_toggles[2*i+1])
             # menu_reactions.add.range_slider('Lower Bound', REACTIONS.lb[i], (-1000,0), 10, font_size=30, range_box_color = 'gold', rangeslider_id=REACTIONS.index[i]+'lb') #, rangeslider_id=OPTIONS['Reactions'][i])
             # menu_reactions.add.range_slider('Upper Bound', REACTIONS.ub[i], (0, 1000), 10, font_size=30, range_box_color = 'gold', rangeslider_id=REACTIONS.index[i]+'ub') #, rangeslider_id=OPTIONS['Reactions'][i])
             
@@ -135,6 +158,9 @@ class Window:
             txt = label.format(GENES[i])
             if txt in genes_02:
                 menu_genes.add.toggle_switch(txt, True, kwargs=txt, toggleswitch_id=txt, background_color = "gold", font_color = "black")
+            elif '02' in self.player.missions_completed and session.essential and txt in session.essential:
+                # essential genes are revealed once mission 02 is done
+                menu_genes.add.toggle_switch(txt, True, kwargs=txt, toggleswitch_id=txt, font_color = "red")
             else:
                 menu_genes.add.toggle_switch(txt, True, kwargs=txt, toggleswitch_id=txt)
         menu_genes.add.vertical_margin(20)
@@ -176,10 +202,10 @@ class Window:
         default_obj = 0
         # print(str(objective))
         
-        for i in range(len(REACTIONS_v0)):
-            if REACTIONS_v0.index[i] == str(objective):
+        for i, r_id in enumerate(session.reactions):
+            if r_id == session.default_objective:
                 default_obj = i
-            objectives.append((REACTIONS_v0.index[i], REACTIONS_v0.index[i]))
+            objectives.append((r_id, r_id))
         
         menu_objective.add.dropselect(title='Objective: ',
                                    items=objectives,
@@ -187,7 +213,7 @@ class Window:
                                    selection_box_height=8,
                                    selection_box_width=500,
                                    dropselect_id='objective')
-        # menu_objective.add.range_slider('Fraction', default=90, range_values=(0,100), increment=1, rangeslider_id='obj_fraction')
+        menu_objective.add.range_slider('Fraction (FVA)', default=90, range_values=(0,100), increment=1, rangeslider_id='obj_fraction')
 
         menu_objective.add.vertical_margin(30)
         menu_objective.add.label("TIP: \nBy default, you want \"Biomass” to be set as the objective because you want to see if E. Coli can grow or even survive in the environment you create.",
@@ -203,6 +229,20 @@ class Window:
 
         
 
+        def menu_request():
+            return SimulationRequest.from_menu(menu.get_input_data(), menu_objective.get_input_data(),
+                                               menu_genes.get_input_data(), menu_reactions.get_input_data(),
+                                               session)
+
+
+        def screen_request():
+            # screens and sweeps need one growth value per run: FVA ranges are run as FBA
+            base = menu_request()
+            if base.method == 'FVA':
+                base = replace(base, method='FBA')
+            return base
+
+
         def data_fun() -> None:
             """
             Print data of the menu.
@@ -218,14 +258,21 @@ class Window:
                 menu_id='menu_new_results'
             )
 
-            data_simul = menu.get_input_data()
-            data_objective = menu_objective.get_input_data()
-            data_genes = menu_genes.get_input_data()
-            data_reac = menu_reactions.get_input_data()
-
-            save_simulation_file([data_simul, data_objective, data_genes, data_reac])
-            animation_text_save('Running')
-            self.results = run_simul()
+            request = menu_request()
+            if request.method == 'FVA':
+                fva_fun(request)
+                return
+            ticket = self.worker.submit(request, self.model_name)
+            answer = wait_simulation(self.worker, ticket)
+            if answer is None:
+                animation_text_save('Simulation cancelled')
+                return
+            status, results = answer
+            if status == 'error':
+                animation_text_save('Simulation failed')
+                return
+            self.history.append(request, results)
+            self.results = results.summary() # formatted only here, for the menu
             self.player.results.insert(0,self.results)
             try:
                 menu.remove_widget('new_results')
@@ -254,9 +301,172 @@ class Window:
                     menu_simul.remove_widget('deadmargin')
                 except:
                     pass
+            nutrients = limiting_nutrients(results, exchanges=set(session.exchange_ids))
+            if nutrients:
+                # from the duals of the same FBA solve, no extra runs
+                menu_simul.add.label('Limiting nutrients (objective gained per unit of extra uptake):', font_size=24)
+                for r_id, gain in nutrients:
+                    menu_simul.add.label(f'{r_id}    {gain}', font_size=22)
+                menu_simul.add.vertical_margin(30)
             menu_simul.add.button('Close', pygame_menu.events.BACK, background_color=(70, 70, 70), button_id='nr_close')
 
 
+        def show_screen(title, header, rows, button_id):
+            menu_screen = pygame_menu.Menu(
+                height=720,
+                onclose=pygame_menu.events.BACK,
+                theme=mytheme,
+                title=title,
+                width=1280
+            )
+            menu_screen.add.label(header, font_size=30)
+            menu_screen.add.vertical_margin(30)
+            for name, value in rows:
+                menu_screen.add.label(f'{name}    {value}', font_size=26)
+            menu_screen.add.vertical_margin(30)
+            menu_screen.add.button('Close', pygame_menu.events.BACK, background_color=(70, 70, 70))
+
+            try:
+                menu.remove_widget(button_id)
+            except:
+                pass
+            menu.add.button(title, action=menu_screen, font_color = 'white', background_color=(0,150,50), button_id=button_id)
+
+
+        def screen_fun() -> None:
+            """
+            Knock out every gene, one at a time, on top of the current options.
+            """
+            base = screen_request()
+            pool = ScreenPool(model_path, compress=base.method == 'FBA', session=session)
+            status, results = wait_screen(screen_genes(pool, GENES, base), len(GENES), pool.terminate, 'Screening genes')
+            if status == 'cancelled':
+                animation_text_save('Screen cancelled')
+                return
+            if status == 'error':
+                animation_text_save('Screen failed')
+                return
+            pool.close()
+            show_screen('Gene Screen', "Growth with each gene knocked out (lowest first):", [(gene, result[1]) for gene, result in rank(results, reverse=False)], 'screen_results')
+
+
+        def media_fun() -> None:
+            """
+            Replace glucose by each exchange in turn, on top of the current options.
+            """
+            candidates = [r_id for r_id in REACTIONS.index if r_id != 'EX_glc__D_e']
+            base = screen_request()
+            pool = ScreenPool(model_path, compress=base.method == 'FBA', session=session)
+            status, results = wait_screen(screen_media(pool, candidates, 'EX_glc__D_e', base), len(candidates), pool.terminate, 'Screening carbon sources')
+            if status == 'cancelled':
+                animation_text_save('Screen cancelled')
+                return
+            if status == 'error':
+                animation_text_save('Screen failed')
+                return
+            pool.close()
+            show_screen('Carbon Source Screen', "Growth without glucose, opening each exchange (best first):", [(r_id, result[1]) for r_id, result in rank(results)], 'media_results')
+
+
+        def fva_fun(request) -> None:
+            """
+            Flux ranges of the exchange reactions, solved over the worker pool.
+            """
+            pool = ScreenPool(model_path, compress=True, session=session)
+            total = len(split(list(REACTIONS.index), 8))
+            status, results = wait_screen(fva(pool, request, REACTIONS.index, 8), total, pool.terminate, 'Running FVA')
+            if status == 'cancelled':
+                animation_text_save('Simulation cancelled')
+                return
+            if status == 'error':
+                animation_text_save('Simulation failed')
+                return
+            pool.close()
+
+            ranges = {}
+            for chunk in results:
+                ranges.update(chunk)
+            rows = [(r_id, f'[{ranges[r_id][0]:.3f}, {ranges[r_id][1]:.3f}]') for r_id in REACTIONS.index]
+            show_screen('FVA Results', f"Flux range of each exchange at {round(request.fraction * 100)}% of the optimum:", rows, 'fva_results')
+
+
+        # MENU SUB SWEEP
+        menu_sweep = pygame_menu.Menu(
+            height=720,
+            onclose=pygame_menu.events.BACK,
+            theme=mytheme,
+            title='Uptake Sweep',
+            width=1280
+        )
+        exchanges = [(r_id, r_id) for r_id in REACTIONS.index]
+        default_x = REACTIONS.index.get_loc('EX_glc__D_e') if 'EX_glc__D_e' in REACTIONS.index else 0
+        default_y = REACTIONS.index.get_loc('EX_o2_e') + 1 if 'EX_o2_e' in REACTIONS.index else 0
+        menu_sweep.add.dropselect(title='Uptake of (x): ', items=exchanges, default=default_x,
+                                  selection_box_height=6, selection_box_width=400, dropselect_id='sweep_x')
+        menu_sweep.add.dropselect(title='Uptake of (y): ', items=[('None', '')] + exchanges, default=default_y,
+                                  selection_box_height=6, selection_box_width=400, dropselect_id='sweep_y')
+        menu_sweep.add.range_slider('Max uptake', default=20, range_values=(1,100), increment=1, rangeslider_id='sweep_max')
+        menu_sweep.add.range_slider('Steps', default=11, range_values=(2,41), increment=1, rangeslider_id='sweep_steps')
+
+
+        def sweep_fun() -> None:
+            """
+            Growth over a grid of uptake rates of one or two exchanges, on top
+            of the current options, drawn as a heatmap.
+            """
+            data = menu_sweep.get_input_data()
+            x_id = data['sweep_x'][0][1]
+            y_id = data['sweep_y'][0][1]
+            if x_id == y_id:
+                y_id = ''
+            uptakes = np.linspace(0, data['sweep_max'], int(data['sweep_steps'])).round(3).tolist()
+
+            base = screen_request()
+            pool = ScreenPool(model_path, compress=base.method == 'FBA', session=session)
+            rows = len(uptakes) if y_id else 1
+            status, results = wait_screen(sweep(pool, base, x_id, uptakes, y_id, uptakes), rows, pool.terminate, 'Sweeping')
+            if status == 'cancelled':
+                animation_text_save('Sweep cancelled')
+                return
+            if status == 'error':
+                animation_text_save('Sweep failed')
+                return
+            pool.close()
+            grid = sweep_grid(results, len(uptakes))
+
+            menu_sweep_results = pygame_menu.Menu(
+                height=720,
+                onclose=pygame_menu.events.BACK,
+                theme=mytheme,
+                title='Sweep Results',
+                width=1280
+            )
+            best = np.nanmax(grid) if not np.isnan(grid).all() else 0
+            menu_sweep_results.add.label(f'{base.objective or session.default_objective} (highest {round(best, 3)})', font_size=26)
+            menu_sweep_results.add.vertical_margin(10)
+            menu_sweep_results.add.surface(heatmap_surface(grid, (640, 400 if y_id else 80)))
+            menu_sweep_results.add.label(f'x: {x_id} uptake 0 - {uptakes[-1]}', font_size=22)
+            if y_id:
+                menu_sweep_results.add.label(f'y: {y_id} uptake 0 - {uptakes[-1]} (bottom to top)', font_size=22)
+            else:
+                for uptake, value in zip(uptakes, grid[0]):
+                    menu_sweep_results.add.label(f'{uptake}    {round(value, 3)}', font_size=22)
+            menu_sweep_results.add.vertical_margin(20)
+            menu_sweep_results.add.button('Close', pygame_menu.events.BACK, background_color=(70, 70, 70))
+
+            try:
+                menu_sweep.remove_widget('sweep_results')
+            except:
+                pass
+            menu_sweep.add.button('Sweep Results', action=menu_sweep_results, font_color = 'white', background_color=(0,150,50), button_id='sweep_results')
+
+        menu_sweep.add.vertical_margin(30)
+        menu_sweep.add.button('Run Sweep', action=sweep_fun, font_color = 'white', background_color=(20,100,100))
+        menu_sweep.add.vertical_margin(20)
+        menu_sweep.add.button('Back', pygame_menu.events.BACK, background_color=(70, 70, 70))
+        menu_sweep.add.vertical_margin(20)
+
+
         # def restore_data() -> None:
         #     """
         #     """
@@ -271,14 +481,26 @@ class Window:
         menu.add.label('Change options: ', font_size = 40)
         menu.add.vertical_margin(20)
 
+        def change_model(selected, name) -> None:
+            if name != self.model_name:
+                self.model_name = name
+                menu.disable() # leaves the mainloop; setup() builds the menus again for the new model
+
+        models = [(name, name) for name in registry.available()]
+        menu.add.dropselect(title='Model ',
+                            items=models,
+                            default=models.index((self.model_name, self.model_name)),
+                            onchange=change_model,
+                            selection_box_height=4, dropselect_id='model', background_color="white", font_color=(20,0,150))
         menu.add.dropselect(title='Simulation Method ',
                             items=[('FBA', 'fba'),
                                    ('pFBA', 'pfba'),
                                 #    ('MOMA', 'moma'),
                                    ('lMOMA', 'lmoma'),
-                                   ('ROOM','room')],
+                                   ('ROOM','room'),
+                                   ('FVA','fva')],
                                    default=0,
-                                   selection_box_height=5, dropselect_id='method', background_color="white", font_color=(20,0,150))
+                                   selection_box_height=6, dropselect_id='method', background_color="white", font_color=(20,0,150))
         menu.add.button('Objective', menu_objective, font_color = (20,0,150), background_color="white")
         menu.add.button('Genes', menu_genes, font_color = (20,0,150), background_color="white")
         menu.add.button('Environmental Conditions', menu_reactions, font_color = (20,0,150), background_color="white")
@@ -289,6 +511,12 @@ class Window:
 
         menu.add.button('Run Simulation', action=data_fun, font_color = 'white', background_color=(20,100,100))        
         menu.add.vertical_margin(20)  # Adds margin
+        menu.add.button('Screen all Genes', action=screen_fun, font_color = 'white', background_color=(20,100,100))
+        menu.add.vertical_margin(20)  # Adds margin
+        menu.add.button('Screen Carbon Sources', action=media_fun, font_color = 'white', background_color=(20,100,100))
+        menu.add.vertical_margin(20)  # Adds margin
+        menu.add.button('Uptake Sweep', menu_sweep, font_color = 'white', background_color=(20,100,100))
+        menu.add.vertical_margin(20)  # Adds margin
         # last_results = menu.add.button('Results Log', action=menu_results, font_color = 'black', background_color="grey")  
         # menu.add.vertical_margin(50)  # Adds margin
 